@@ -1,70 +1,78 @@
 import os
 import pandas as pd
 from tqdm import tqdm
-import jieba
 import matplotlib.pyplot as plt
-import re
 import numpy as np
 import seaborn as sns
 from json_operations import sample_from_multiple_json
+from corpus_statistics import count_corpus, count_words, is_chinese, iterate_chinese_word_counts
+from word_count_cache import WordCountCache
+from category_index import CategoryIndex, category_index_paths
+from corpus_reader import find_corpus_files
 
 
-def basic_statistics(path_to_jsons, number_json_files, language='en', plot=True):
+def basic_statistics(path_to_jsons, number_json_files, language='en', plot=True, workers=1, word_count_cache=None):
     '''Loop through all the json and gather statistics for the corpus.
     '''
     number_json_files = int(number_json_files)
-    tot_words, tot_char, tot_size, tot_categories = get_global_counts(path_to_jsons, number_json_files, language)
+    category_index = get_category_index(path_to_jsons, number_json_files)
+    # The category index already has the total number of categories.
+    tot_words, tot_char, tot_size, tot_categories = get_global_counts(path_to_jsons, number_json_files, language,
+                                                                      workers, word_count_cache,
+                                                                      count_categories=category_index is None)
+    if category_index is not None:
+        tot_categories = category_index.total_categories
     if plot:
         json_sample, tot_biographies = sample_from_multiple_json(path_to_jsons, nr_samples=50000, json_file_size=50000, total_json_files=number_json_files)
-        category_counts, char_counts, word_counts = process_sample_for_plotting(json_sample, language)
+        category_counts, char_counts, word_counts = process_sample_for_plotting(json_sample, language, workers,
+                                                                                word_count_cache)
         plot_word_char_histogram(char_counts, word_counts, language)
         plot_word_char_density(char_counts, word_counts, language)
         # Pronoun values need to be manully calculated, here's an example
         # plot_pronoun(feminine=240485, masculine=842644, neutral=93448, 'en')
     print_basic_statistics(json_sample, tot_biographies, tot_words, tot_char, tot_size, tot_categories, language)
-    
-def get_global_counts(path_to_jsons, number_json_files, language):
-    tot_words = 0
-    tot_chars = 0
-    tot_categories = 0
-    tot_size = 0
-    for i in range(number_json_files):
-        corpus_batch_df = pd.read_json(path_to_jsons + "_" + str(i) + ".json")
-        tot_size += os.path.getsize(path_to_jsons + "_" + str(i) + ".json")
-        tot_categories += corpus_batch_df["categories"].apply(len).sum()
-        tot_chars += corpus_batch_df["text"].apply(len).sum()
-
-        for i, row in corpus_batch_df.iterrows():
-            # Chinese don't seperate words with spaces so jieba is required to split into words
-            if (language == "zh") or (language == "chinese"):
-                word_count = jieba.cut(row.text, cut_all=False)  # use jieba to split Chinese into words
-                tot_words += len(list(word_count))
-            else:
-                word_count = re.split('\s+', row.text)  # splitting into words for non-Chinese languages
-                tot_words += len(list(word_count))
-    return tot_words, tot_chars, tot_size, tot_categories
-
-def process_sample_for_plotting(json_sample, language):
+    if category_index is not None:
+        print_category_statistics(category_index)
+
+
+def get_category_index(path_to_jsons, number_json_files):
+    '''The category index of the corpus (see category_index.py) if it
+        was built and the statistics are for the whole corpus.
+    '''
+    if not os.path.exists(category_index_paths(path_to_jsons)[1]):
+        return None
+    if len(find_corpus_files(path_to_jsons)) > number_json_files:
+        return None
+    return CategoryIndex(path_to_jsons)
+
+
+def get_global_counts(path_to_jsons, number_json_files, language, workers=1, word_count_cache=None,
+                      count_categories=True):
+    '''The files are counted in parallel with workers processes,
+        see corpus_statistics.py. word_count_cache is the path of
+        the cache of the Chinese word counts. Without
+        count_categories the categories are not read (0).
+    '''
+    counts = count_corpus(path_to_jsons, language, number_json_files, workers, word_count_cache, count_categories)
+    return counts.words, counts.chars, counts.size, counts.categories
+
+def process_sample_for_plotting(json_sample, language, workers=1, word_count_cache=None):
     categories = json_sample['categories'].tolist()
     texts = json_sample['text'].tolist()
-    category_counts = []
-    word_counts = []
-    char_counts = []
-
-    for i in tqdm(range(len(json_sample))):
-        category_count = len(categories[i])
-        category_counts.append(category_count)
-
-        text_i = texts[i]
-        char_counts.append(len(text_i))
-        
-        # Chinese don't seperate words with spaces so jieba is required to split into words
-        if (language == "zh") or (language == "chinese"):
-            word_count = jieba.cut(text_i, cut_all=False)  # use jieba to split Chinese into words
-            word_counts.append(len(list(word_count)))
-        else:
-            word_count = re.split('\s+', text_i)  # splitting into words for non-Chinese languages
-            word_counts.append(len(word_count))
+    category_counts = [len(categories_i) for categories_i in categories]
+    char_counts = [len(text_i) for text_i in texts]
+
+    # Chinese don't seperate words with spaces so jieba is required to split into words
+    if is_chinese(language):
+        records = zip(json_sample['id'].tolist(), texts)
+        cache = None if word_count_cache is None else WordCountCache(word_count_cache)
+        try:
+            word_counts = list(tqdm(iterate_chinese_word_counts(records, workers, cache), total=len(texts)))
+        finally:
+            if cache is not None:
+                cache.close()
+    else:
+        word_counts = [count_words(text_i, language) for text_i in tqdm(texts)]
 
     return category_counts, char_counts, word_counts
 
@@ -184,5 +192,14 @@ def print_basic_statistics(json_sample, tot_biographies, tot_words, tot_char, to
     print(f"Average number of categories per biography: {tot_categories/tot_biographies}")
 
 
+def print_category_statistics(category_index, number_categories=20):
+    '''Print the category frequencies from the category index.
+    '''
+    print(f"Number of different categories: {len(category_index)}")
+    print(f"Top {number_categories} categories:")
+    for category, count in category_index.top_categories(number_categories):
+        print(f"    {category}: {count}")
+
+
 # basic_statistics('./english_sample_long.json', 'en')
 
@@ -0,0 +1,411 @@
+'''Benchmarks of the text processing.
+    Example usage:
+    python benchmark.py -p dumps/enwiki-20221220ms24.xml -l english -n 2000
+
+    Identifying biographies (on all pages, also the non-biographies)
+    python benchmark.py -p dumps/enwiki-20221220ms24.xml -l english -n 100000 --identification
+
+    The suite (extraction stages, cleaning steps and identification) on a
+    synthetic dump, compared with the results of an earlier run
+    python benchmark.py --suite -l english --synthetic-pages 5000 -o results.json --baseline baseline.json
+
+    Checking that the memory of the parsers does not grow while reading a 4 GB synthetic dump
+    python benchmark.py --memory --memory-dump-mb 4000
+'''
+
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from argparse import ArgumentParser
+from multistream import open_dump
+from page_scanner import scan_dump, READ_SIZE
+from regex_patterns import regex_patterns_by_language
+from biography_classifier import get_biography_identifier, IDENTIFIERS
+from text_processing import process_text_reference, get_cleaning_pipeline, CLEANING_ENGINES
+from dump_fixtures import write_synthetic_dump, SyntheticDumpStream
+from process_xml import process_xml, iterate_dump_pages, PARSERS
+from profiling import profiling_on, rss_mb
+
+# Metrics faster than this (seconds per article/page) are too noisy
+# to compare with the baseline.
+MIN_COMPARED_SECONDS = 1e-5
+# Times the memory is measured while reading the dump in --memory.
+MEMORY_SAMPLES = 20
+
+
+ARG_PARSER = ArgumentParser(
+    description=("Example usage: \n "
+                 "python benchmark.py -p dumps/enwiki-20221220ms24.xml -l english -n 2000")
+)
+
+ARG_PARSER.add_argument(
+    "-p",
+    "--wiki-dump-path",
+    default=None,
+    help=(
+        "Path to the dump the biographies are taken from. \n"
+        "Without it a synthetic dump of --synthetic-pages pages is generated (see dump_fixtures.py)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-l",
+    "--language",
+    default="english",
+    help=(
+        "Choose the language."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-n",
+    "--nr-articles",
+    default=1000,
+    help=(
+        "Number of biographies to run the benchmark on."
+    ),
+)
+
+
+ARG_PARSER.add_argument(
+    "--identification",
+    action="store_true",
+    help=(
+        "Benchmark the identifying regex against the BiographyClassifier on the first -n pages \n"
+        "instead of the cleaning."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--suite",
+    action="store_true",
+    help=(
+        "Run all benchmarks: the extraction of the dump with the time of every stage, \n"
+        "every cleaning step of every engine and the identification. Saved as json to --output."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--synthetic-pages",
+    default=2000,
+    help=(
+        "Number of pages of the synthetic dump, used without -p."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--seed",
+    default=0,
+    help=(
+        "Seed of the synthetic dump."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-o",
+    "--output",
+    default="benchmark_results.json",
+    help=(
+        "Where the results of --suite are saved."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--baseline",
+    default=None,
+    help=(
+        "Results of an earlier --suite run to compare with. Exits with status 1 if a metric \n"
+        "is more than --threshold slower."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--threshold",
+    default=0.1,
+    help=(
+        "Allowed slowdown compared with the baseline, 0.1 is 10%%."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--repeat",
+    default=3,
+    help=(
+        "Number of runs of every benchmark in --suite, the fastest run counts."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--memory",
+    action="store_true",
+    help=(
+        "Read a synthetic dump of --memory-dump-mb MB with every parser, while it is generated and from a \n"
+        "plain file in a temporary directory, and measure the memory. Exits with status 1 if it grows more \n"
+        "than --max-memory-growth MB after the first tenth of the dump."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--memory-dump-mb",
+    default=2000,
+    help=(
+        "Size of the dump of --memory in MB."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--max-memory-growth",
+    default=20,
+    help=(
+        "Allowed growth of the memory in --memory in MB."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-w",
+    "--workers",
+    default=1,
+    help=(
+        "Number of processes for the extraction in --suite."
+    ),
+)
+
+
+def load_biography_texts(xml_path, language, nr_articles):
+    '''Returns the raw text of the first nr_articles biographies in the dump.
+    '''
+    biography_regex = re.compile(regex_patterns_by_language[language]["biograpy_identifying_regex"])
+    texts = []
+    with open_dump(xml_path) as dump_file:
+        for page_id, title, redirect, text, revision_id, timestamp in scan_dump(dump_file, biography_regex):
+            texts.append(text)
+            if len(texts) >= nr_articles:
+                break
+    return texts
+
+
+def load_page_texts(xml_path, nr_pages):
+    '''Returns the raw text of the first nr_pages pages (that are
+        not redirects) in the dump, biographies or not.
+    '''
+    any_page = re.compile("")
+    texts = []
+    with open_dump(xml_path) as dump_file:
+        for page_id, title, redirect, text, revision_id, timestamp in scan_dump(dump_file, any_page):
+            texts.append(text)
+            if len(texts) >= nr_pages:
+                break
+    return texts
+
+
+def time_per_article(function, texts):
+    '''Runs function on every text. Returns the outputs
+        and the average time per article in seconds.
+    '''
+    start = time.perf_counter()
+    outputs = [function(text) for text in texts]
+    return outputs, (time.perf_counter() - start) / len(texts)
+
+
+def benchmark_cleaning_pipeline(texts, language):
+    '''Compares every cleaning engine with process_text_reference.
+        Counts the outputs that are not identical.
+    '''
+    reference_outputs, reference_time = time_per_article(lambda text: process_text_reference(text, language), texts)
+    print(f"Articles: {len(texts)}")
+    print(f"process_text_reference: {reference_time * 1000:.3f} ms per article")
+
+    for engine in CLEANING_ENGINES:
+        pipeline = get_cleaning_pipeline(language, engine)
+        outputs, engine_time = time_per_article(pipeline.clean, texts)
+        mismatches = sum(reference != output for reference, output in zip(reference_outputs, outputs))
+        print(f"{engine}: {engine_time * 1000:.3f} ms per article, "
+              f"speedup {reference_time / engine_time:.2f}x, mismatching outputs: {mismatches}")
+
+
+def benchmark_identification(texts, language):
+    '''Compares the identifying regex with the BiographyClassifier
+        on all pages and separately on the non-biographies, where
+        the regex has to search the whole text.
+    '''
+    identifiers = {identifier: get_biography_identifier(language, identifier) for identifier in IDENTIFIERS}
+    decisions, regex_time = time_per_article(lambda text: bool(identifiers["regex"].search(text)), texts)
+    other_texts = [text for text, decision in zip(texts, decisions) if not decision]
+    print(f"Pages: {len(texts)}, biographies: {len(texts) - len(other_texts)}")
+    print(f"regex: {regex_time * 1e6:.1f} µs per page")
+
+    for identifier in IDENTIFIERS:
+        if identifier == "regex":
+            continue
+        outputs, identifier_time = time_per_article(lambda text: bool(identifiers[identifier].search(text)), texts)
+        mismatches = sum(decision != output for decision, output in zip(decisions, outputs))
+        print(f"{identifier}: {identifier_time * 1e6:.1f} µs per page, "
+              f"speedup {regex_time / identifier_time:.2f}x, different decisions: {mismatches}")
+
+    if other_texts:
+        for identifier in IDENTIFIERS:
+            outputs, identifier_time = time_per_article(identifiers[identifier].search, other_texts)
+            print(f"{identifier} on non-biographies: {identifier_time * 1e6:.1f} µs per page")
+
+
+def run_suite(xml_path, language, nr_articles, repeat=3, workers=1):
+    '''Runs all benchmarks repeat times. Returns the results with
+        the metrics in seconds per page (extraction, identification)
+        or per biography (cleaning), the fastest of the runs.
+    '''
+    metrics = {}
+
+    def add_metric(metric, seconds):
+        metrics[metric] = min(seconds, metrics.get(metric, seconds))
+
+    with tempfile.TemporaryDirectory() as directory:
+        profile_path = os.path.join(directory, "profile.json")
+        for _ in range(repeat):
+            process_xml(xml_path, os.path.join(directory, "corpus.json"), get_biography_identifier(language),
+                        language, workers=workers, output_format="jsonl", profile_path=profile_path)
+            with open(profile_path, encoding="utf-8") as profile_file:
+                report = json.load(profile_file)
+            pages = max(report["pages"], 1)
+            add_metric("extraction", report["elapsed_seconds"] / pages)
+            for stage, stage_report in report["stages"].items():
+                add_metric("extraction." + stage, stage_report["seconds"] / pages)
+
+    texts = load_biography_texts(xml_path, language, nr_articles)
+    for engine in CLEANING_ENGINES:
+        pipeline = get_cleaning_pipeline(language, engine)
+        for _ in range(repeat):
+            outputs, engine_time = time_per_article(pipeline.clean, texts)
+            add_metric("cleaning." + engine, engine_time)
+            # The steps are timed separately, timing them slows down the whole.
+            with profiling_on() as stage_profile:
+                time_per_article(pipeline.clean, texts)
+            for step, seconds in stage_profile.seconds.items():
+                add_metric("cleaning.{}.{}".format(engine, step[len("clean."):]), seconds / len(texts))
+
+    page_texts = load_page_texts(xml_path, nr_articles)
+    for identifier in IDENTIFIERS:
+        biography_identifier = get_biography_identifier(language, identifier)
+        for _ in range(repeat):
+            outputs, identifier_time = time_per_article(biography_identifier.search, page_texts)
+            add_metric("identification." + identifier, identifier_time)
+
+    return {"settings": {"dump": xml_path, "language": language, "articles": len(texts), "pages": len(page_texts),
+                         "repeat": repeat, "workers": workers, "python": platform.python_version(),
+                         "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+            "metrics": dict(sorted(metrics.items()))}
+
+
+def measure_parser_memory(parser, nr_bytes, language="english", seed=0, dump_path=None):
+    '''Reads a synthetic dump of nr_bytes bytes with parser (see
+        process_xml.PARSERS). With dump_path the dump is first saved
+        there and read from the plain file, otherwise it is read
+        while it is generated. Returns the memory in MB after every
+        MEMORY_SAMPLES-th part of the dump and the number of pages.
+    '''
+    dump = SyntheticDumpStream(nr_bytes, language, seed)
+    nr_pages = None
+    if dump_path is not None:
+        with open(dump_path, "wb") as dump_file:
+            shutil.copyfileobj(dump, dump_file, READ_SIZE)
+        nr_pages = dump.nr_pages
+        dump = open_dump(dump_path)
+    with dump:
+        if parser == "iterparse":
+            pages = iterate_dump_pages(ET.iterparse(dump, events=("start", "end")))
+        else:
+            pages = scan_dump(dump, re.compile(""))
+        samples = []
+        for number, page in enumerate(pages, 1):
+            # The scan parser maps a plain file, so progress is counted in pages.
+            done = number / nr_pages if nr_pages else dump.bytes_read / nr_bytes
+            if done * MEMORY_SAMPLES >= len(samples) + 1:
+                samples.append(rss_mb())
+        samples.append(rss_mb())
+    return samples, nr_pages or dump.nr_pages
+
+
+def check_memory(nr_bytes, language="english", seed=0, max_growth=20):
+    '''Runs measure_parser_memory for every parser, once on the
+        generated dump and once on a plain file. Returns the parsers
+        whose memory grew more than max_growth MB after the first
+        tenth of the dump.
+    '''
+    growing = []
+    with tempfile.TemporaryDirectory() as directory:
+        for parser in PARSERS:
+            for dump_path in (None, os.path.join(directory, "memory.xml")):
+                name = parser if dump_path is None else parser + " (file)"
+                start = time.time()
+                samples, nr_pages = measure_parser_memory(parser, nr_bytes, language, seed, dump_path)
+                growth = max(samples) - samples[MEMORY_SAMPLES // 10 - 1]
+                print("{}: {} pages, {:.0f} MB/s, memory {:.1f} MB -> {:.1f} MB (+{:.1f} MB after the first tenth)".format(
+                    name, nr_pages, nr_bytes / (time.time() - start) / 1e6, samples[0], samples[-1], growth))
+                if growth > max_growth:
+                    growing.append(name)
+    return growing
+
+
+def compare_with_baseline(results, baseline, threshold=0.1):
+    '''Prints the change of every metric compared with the baseline.
+        Returns the metrics that are more than threshold slower.
+    '''
+    regressions = []
+    for metric, seconds in results["metrics"].items():
+        baseline_seconds = baseline["metrics"].get(metric)
+        if baseline_seconds is None or baseline_seconds < MIN_COMPARED_SECONDS:
+            continue
+        change = seconds / baseline_seconds - 1
+        slower = change > threshold
+        if slower:
+            regressions.append(metric)
+        print(f"{metric}: {baseline_seconds * 1e6:.1f} µs -> {seconds * 1e6:.1f} µs ({change:+.1%})"
+              + (" REGRESSION" if slower else ""))
+    return regressions
+
+
+def main():
+    args = ARG_PARSER.parse_args()
+    if args.memory:
+        growing = check_memory(int(float(args.memory_dump_mb) * 1e6), args.language, int(args.seed),
+                               float(args.max_memory_growth))
+        if growing:
+            print("The memory of {} grows with the size of the dump".format(", ".join(growing)))
+            sys.exit(1)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        xml_path = args.wiki_dump_path
+        if xml_path is None:
+            xml_path = os.path.join(directory, "synthetic_{}.xml".format(args.language))
+            write_synthetic_dump(xml_path, int(args.synthetic_pages), args.language, int(args.seed))
+        if args.suite:
+            results = run_suite(xml_path, args.language, int(args.nr_articles), int(args.repeat), int(args.workers))
+            if args.wiki_dump_path is None:
+                results["settings"]["dump"] = "synthetic, {} pages, seed {}".format(args.synthetic_pages, args.seed)
+            with open(args.output, "w", encoding="utf-8") as results_file:
+                json.dump(results, results_file, indent=1)
+            print("Results saved at: " + args.output)
+            if args.baseline is not None:
+                with open(args.baseline, encoding="utf-8") as baseline_file:
+                    baseline = json.load(baseline_file)
+                regressions = compare_with_baseline(results, baseline, float(args.threshold))
+                if regressions:
+                    print("{} metrics are more than {:.0%} slower than the baseline".format(
+                        len(regressions), float(args.threshold)))
+                    sys.exit(1)
+            return
+        if args.identification:
+            texts = load_page_texts(xml_path, int(args.nr_articles))
+            benchmark_identification(texts, args.language)
+            return
+        texts = load_biography_texts(xml_path, args.language, int(args.nr_articles))
+        benchmark_cleaning_pipeline(texts, args.language)
+
+
+if __name__ == "__main__":
+    main()
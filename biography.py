@@ -0,0 +1,73 @@
+'''This file contains the record of an extracted biography. The
+    json batches keep 50'000 of them in memory, so a Biography has
+    slots instead of a dict, and its categories are interned: the
+    same categories (e.g. "Living people") are on thousands of
+    biographies and are then kept only once.
+
+    A Biography can be read like the dict it replaces,
+    biography["id"] or biography.get("revision_id"), and is saved
+    with json_default, e.g. json.dumps(biography, default=json_default).
+'''
+
+import sys
+
+FIELDS = ("id", "title", "names", "categories", "text", "revision_id", "timestamp")
+
+
+class Biography:
+    '''One biography. revision_id and timestamp are only saved if
+        the corpus is extracted with revisions (revisions=True), then
+        always, also when they are None, so every record of a corpus
+        has the same fields.
+    '''
+
+    __slots__ = FIELDS + ("revisions",)
+
+    def __init__(self, page_id, title, names, categories, text, revision_id=None, timestamp=None, revisions=False):
+        self.id = page_id
+        self.title = title
+        self.names = list(names)
+        self.categories = [sys.intern(category) for category in categories]
+        self.text = text
+        self.revision_id = revision_id
+        self.timestamp = timestamp
+        self.revisions = revisions
+
+    def __getitem__(self, key):
+        if key == "length":
+            return len(self.text)
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __reduce__(self):
+        # Pickled as its fields, so the categories are interned
+        # again when the worker processes send it back.
+        return Biography, tuple(getattr(self, field) for field in FIELDS) + (self.revisions,)
+
+    def __repr__(self):
+        return "Biography(id={!r}, title={!r})".format(self.id, self.title)
+
+    def to_dict(self):
+        '''The biography as it is saved, in the order of FIELDS.
+        '''
+        biography = {"id": self.id, "title": self.title, "names": self.names, "categories": self.categories,
+                     "text": self.text}
+        if self.revisions:
+            biography["revision_id"] = self.revision_id
+            biography["timestamp"] = self.timestamp
+        return biography
+
+
+def json_default(value):
+    '''default of json.dump for the Biographies.
+    '''
+    if isinstance(value, Biography):
+        return value.to_dict()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
@@ -0,0 +1,108 @@
+'''This file contains a faster alternative to the biography
+    identifying regexes of regex_patterns.py. The regexes are
+    searched over the whole text of every page, which for
+    patterns like "\\[\\[Category:(Living people|.*deaths|.*births)"
+    means backtracking over the rest of the line at every category
+    link, and for patterns starting with "\\| *" (Russian infobox
+    fields) trying a match at every position of the text.
+
+    The BiographyClassifier gives the same decisions with plain
+    substring searches. It is configured with the rules in
+    regex_patterns.py (biography_identifying_rules), which are:
+
+    "links": (prefix, start, line_contains) triples. A page is a
+        biography if prefix + start is in the text and, if
+        line_contains is not None, line_contains comes after it on
+        the same line. E.g. ("[[Category:", "", "births") is
+        "\\[\\[Category:.*births" and ("[[Category:", "Living people",
+        None) is "\\[\\[Category:Living people".
+    "fields": names of infobox fields. A page is a biography if it
+        contains "|", any number of spaces and the name, which is
+        "\\| *name".
+'''
+
+import re
+from regex_patterns import regex_patterns_by_language
+
+IDENTIFIERS = ("rules", "regex")
+
+
+class BiographyClassifier:
+    '''Drop-in replacement for the compiled identifying regex,
+        search(text) is truthy for the biographies. pattern is the
+        regex the rules replace, only used for printing and for
+        checking the settings of a resumed run.
+    '''
+
+    def __init__(self, rules, pattern=""):
+        self.pattern = pattern
+        # prefix -> [(start, line_contains), ...], every occurrence of
+        # a prefix is only looked at once for all of its rules.
+        self.links = {}
+        for prefix, start, line_contains in rules.get("links", []):
+            self.links.setdefault(prefix, []).append((start, line_contains))
+        # The fields are searched without their first letter, which
+        # is often written in both cases, e.g. "[Дд]ата рождения".
+        self.fields = {}
+        for field in rules.get("fields", []):
+            self.fields.setdefault(field[1:], set()).add(field[0])
+
+    def __repr__(self):
+        return "BiographyClassifier({!r})".format(self.pattern)
+
+    def search(self, text):
+        for prefix, link_rules in self.links.items():
+            if self.search_links(text, prefix, link_rules):
+                return True
+        for field_end, first_letters in self.fields.items():
+            if self.search_field(text, field_end, first_letters):
+                return True
+        return False
+
+    def search_links(self, text, prefix, link_rules):
+        '''Checks every occurrence of prefix against the
+            (start, line_contains) rules. Searches from the end, where
+            the category links of an article are.
+        '''
+        occurrence = text.rfind(prefix)
+        while occurrence != -1:
+            position = occurrence + len(prefix)
+            line_end = None
+            for start, line_contains in link_rules:
+                if not text.startswith(start, position):
+                    continue
+                if line_contains is None:
+                    return True
+                if line_end is None:
+                    line_end = text.find("\n", position)
+                    if line_end == -1:
+                        line_end = len(text)
+                if text.find(line_contains, position + len(start), line_end) != -1:
+                    return True
+            occurrence = text.rfind(prefix, 0, occurrence)
+        return False
+
+    def search_field(self, text, field_end, first_letters):
+        '''Checks for "|", spaces, one of first_letters and field_end.
+        '''
+        position = text.find(field_end, 1)
+        while position != -1:
+            if text[position - 1] in first_letters:
+                before = position - 2
+                while before >= 0 and text[before] == " ":
+                    before -= 1
+                if before >= 0 and text[before] == "|":
+                    return True
+            position = text.find(field_end, position + 1)
+        return False
+
+
+def get_biography_identifier(language, identifier="rules"):
+    '''Returns the compiled identifying regex of the language, or
+        with identifier="rules" the BiographyClassifier if the
+        language has rules.
+    '''
+    patterns = regex_patterns_by_language[language]
+    if identifier == "rules" and "biography_identifying_rules" in patterns:
+        return BiographyClassifier(patterns["biography_identifying_rules"], patterns["biograpy_identifying_regex"])
+    return re.compile(patterns["biograpy_identifying_regex"])
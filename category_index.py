@@ -0,0 +1,127 @@
+'''This file contains an inverted index of the categories of a
+    saved corpus, from every category to the sorted page ids of its
+    biographies. It is saved next to the corpus in two files, e.g.
+    wiki_data/enwiki.categories.npy with the ids of all categories
+    one after the other (uint32), which is memory-mapped when the
+    index is opened, and wiki_data/enwiki.categories.json with the
+    start and number of ids of every category.
+
+    The page ids of Wikipedia are numbers, a corpus with other ids
+    can not be indexed.
+'''
+
+import array
+import json
+import numpy as np
+from tqdm import tqdm
+from corpus_reader import corpus_prefix, find_corpus_files, iterate_file_records
+
+
+def category_index_paths(save_path):
+    '''wiki_data/enwiki.json -> (wiki_data/enwiki.categories.npy, wiki_data/enwiki.categories.json)
+    '''
+    prefix = corpus_prefix(save_path)
+    return prefix + ".categories.npy", prefix + ".categories.json"
+
+
+def build_category_index(save_path):
+    '''Builds the category index of the corpus at save_path (any
+        format of corpus_reader.py). The ids of a category are
+        collected as uint32 arrays while reading the corpus.
+    '''
+    ids_by_category = {}
+    nr_biographies = 0
+    # All category links, also a category that is twice on a page,
+    # the same as the total number of categories of get_global_counts.
+    total_categories = 0
+    for path in tqdm(find_corpus_files(save_path)):
+        for page_id, categories in iterate_file_records(path, ["id", "categories"]):
+            nr_biographies += 1
+            total_categories += len(categories)
+            for category in categories:
+                if category not in ids_by_category:
+                    ids_by_category[category] = array.array("I")
+                ids_by_category[category].append(int(page_id))
+
+    positions = {}
+    start = 0
+    for category in sorted(ids_by_category):
+        ids_by_category[category] = np.unique(np.frombuffer(ids_by_category[category], dtype=np.uint32))
+        positions[category] = [start, len(ids_by_category[category])]
+        start += len(ids_by_category[category])
+
+    ids_path, categories_path = category_index_paths(save_path)
+    with open(ids_path, "wb") as ids_file:
+        # A .npy file written one category at a time.
+        np.lib.format.write_array_header_1_0(ids_file, {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(np.uint32)), "fortran_order": False, "shape": (start,)})
+        for category in positions:
+            ids_by_category[category].tofile(ids_file)
+    with open(categories_path, "w", encoding="utf-8") as categories_file:
+        json.dump({"biographies": nr_biographies, "total_categories": total_categories, "categories": positions},
+                  categories_file, ensure_ascii=False)
+    print("Indexed {} categories of {} biographies at: {}".format(len(positions), nr_biographies, ids_path))
+    return ids_path
+
+
+class CategoryIndex:
+    '''The category index of the corpus at save_path. ids returns
+        the sorted page ids of a category as a (memory-mapped) numpy
+        array, the page ids can be looked up with corpus_index.py.
+    '''
+
+    def __init__(self, save_path):
+        ids_path, categories_path = category_index_paths(save_path)
+        with open(categories_path, encoding="utf-8") as categories_file:
+            metadata = json.load(categories_file)
+        self.nr_biographies = metadata["biographies"]
+        self.total_categories = metadata["total_categories"]
+        self.positions = metadata["categories"]
+        self.ids_array = np.load(ids_path, mmap_mode="r")
+
+    def __contains__(self, category):
+        return category in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def ids(self, category):
+        '''The page ids of the biographies in category.
+        '''
+        if category not in self.positions:
+            return np.array([], dtype=np.uint32)
+        start, count = self.positions[category]
+        return self.ids_array[start:start + count]
+
+    def count(self, category):
+        return self.positions[category][1] if category in self.positions else 0
+
+    def intersection(self, *categories):
+        '''The ids of the biographies in all of the categories,
+            starting with the smallest category. Empty without
+            categories.
+        '''
+        if not categories:
+            return np.array([], dtype=np.uint32)
+        categories = sorted(categories, key=self.count)
+        ids = np.asarray(self.ids(categories[0]))
+        for category in categories[1:]:
+            if not len(ids):
+                break
+            ids = np.intersect1d(ids, self.ids(category), assume_unique=True)
+        return ids
+
+    def union(self, *categories):
+        '''The ids of the biographies in any of the categories.
+            Empty without categories.
+        '''
+        if not categories:
+            return np.array([], dtype=np.uint32)
+        return np.unique(np.concatenate([self.ids(category) for category in categories]))
+
+    def top_categories(self, n=20):
+        '''The n categories with the most biographies as (category, count).
+        '''
+        counts = sorted(((category, count) for category, (start, count) in self.positions.items()),
+                        key=lambda item: (-item[1], item[0]))
+        return counts[:n]
@@ -0,0 +1,59 @@
+'''This file contains the checkpoints of an extraction run.
+    process_xml saves a checkpoint every time an output file is
+    finished. It holds the settings of the run, how many files and
+    biographies are done, the id of the last biography in the
+    finished files, the input position to continue reading from
+    and the count and size of the quarantine file at that point.
+    With --resume a run that died continues from the last
+    checkpoint instead of from the start of the dump.
+
+    The checkpoint is saved next to the output, e.g.
+    wiki_data/enwiki.checkpoint.json, and removed when the run
+    is finished.
+'''
+
+import json
+import os
+from corpus_reader import corpus_prefix
+
+
+def checkpoint_path(save_path):
+    '''wiki_data/enwiki.json -> wiki_data/enwiki.checkpoint.json
+    '''
+    return corpus_prefix(save_path) + ".checkpoint.json"
+
+
+def save_checkpoint(path, checkpoint):
+    '''Writes the checkpoint to a temporary file first, so a crash
+        while saving leaves the previous checkpoint intact.
+    '''
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, ensure_ascii=False)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    '''Returns the checkpoint at path or None if there is none.
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def check_checkpoint_settings(checkpoint, settings):
+    '''Raises a ValueError if the run that saved the checkpoint
+        used other settings, e.g. another dump or output format.
+    '''
+    for key, value in settings.items():
+        if checkpoint["settings"].get(key) != value:
+            raise ValueError("Can not resume, {} was {} and is now {}".format(
+                key, checkpoint["settings"].get(key), value))
+
+
+def remove_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,176 @@
+'''This file contains an on-disk cache of the cleaned texts.
+    Many pages are byte-identical between two dumps, so cleaning
+    them again is wasted work. The cache is a SQLite database
+    with the output of process_text (text, names and categories)
+    keyed by a hash of the language, the cleaning engine and
+    CLEANING_VERSION, and the raw text.
+
+    Every process (main process or worker) opens its own
+    connection and writes in batches of COMMIT_EVERY entries.
+    After the run the least recently used entries are removed
+    until the cache is below its maximum size. Every connection
+    counts its hits and misses and saves them in the database
+    too, so the report of the run also covers the worker processes.
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from multiprocessing import util
+from text_processing import process_text, CLEANING_VERSION
+
+COMMIT_EVERY = 500
+# Default maximum size of the cached values, 10 GB.
+MAX_CACHE_BYTES = 10 * 1024 ** 3
+# Waiting for the other processes to finish writing.
+BUSY_TIMEOUT = 60
+
+
+# The caches opened by this process (and, after a fork, its parent).
+open_caches = {}
+
+
+def cached_process_text(text, language, engine, cache_path, time_budget=None):
+    '''process_text but the output is taken from the cache
+        at cache_path if the same text was cleaned before.
+    '''
+    cache = get_clean_cache(cache_path, language, engine)
+    cleaned = cache.get(text)
+    if cleaned is None:
+        cleaned = process_text(text, language, engine, time_budget)
+        cache.put(text, cleaned)
+    return cleaned
+
+
+def get_clean_cache(cache_path, language, engine):
+    '''Returns the cache of this process. The process id is part
+        of the key so a forked worker does not use the connection
+        of its parent. The cache is closed (and the last entries
+        written) when the process exits.
+    '''
+    key = (cache_path, language, engine, os.getpid())
+    if key not in open_caches:
+        cache = CleanCache(cache_path, language, engine)
+        util.Finalize(cache, cache.close, exitpriority=10)
+        open_caches[key] = cache
+    return open_caches[key]
+
+
+def close_clean_caches():
+    '''Writes and closes the caches opened by this process.
+    '''
+    for key, cache in list(open_caches.items()):
+        if key[3] == os.getpid():
+            cache.close()
+            del open_caches[key]
+
+
+def connect(cache_path):
+    connection = sqlite3.connect(cache_path, timeout=BUSY_TIMEOUT)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS cleaned ("
+                       "key BLOB PRIMARY KEY, value BLOB, size INTEGER, created REAL, last_used REAL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS cleaned_last_used ON cleaned (last_used)")
+    connection.execute("CREATE TABLE IF NOT EXISTS lookups ("
+                       "pid INTEGER, opened REAL, hits INTEGER, misses INTEGER, PRIMARY KEY (pid, opened))")
+    return connection
+
+
+class CleanCache:
+    '''The connection of one process to the cache. New entries,
+        the last use of found entries and the number of hits and
+        misses are written in batches.
+    '''
+
+    def __init__(self, cache_path, language, engine):
+        self.connection = connect(cache_path)
+        self.key_prefix = "{}\0{}\0{}\0".format(language, engine, CLEANING_VERSION).encode("utf-8")
+        self.new_entries = []
+        self.used_keys = []
+        self.opened = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.closed = False
+
+    def key(self, text):
+        return hashlib.sha256(self.key_prefix + text.encode("utf-8")).digest()
+
+    def get(self, text):
+        key = self.key(text)
+        row = self.connection.execute("SELECT value FROM cleaned WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used_keys.append(key)
+        self.commit_if_full()
+        cleaned_text, names, categories = json.loads(zlib.decompress(row[0]))
+        return cleaned_text, names, categories
+
+    def put(self, text, cleaned):
+        value = zlib.compress(json.dumps(cleaned, ensure_ascii=False).encode("utf-8"))
+        self.new_entries.append((self.key(text), value, len(value)))
+        self.commit_if_full()
+
+    def commit_if_full(self):
+        if len(self.new_entries) + len(self.used_keys) >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cleaned (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(key, value, size, now, now) for key, value, size in self.new_entries])
+            self.connection.executemany("UPDATE cleaned SET last_used = ? WHERE key = ?",
+                                        [(now, key) for key in self.used_keys])
+            self.connection.execute("INSERT OR REPLACE INTO lookups (pid, opened, hits, misses) VALUES (?, ?, ?, ?)",
+                                    (os.getpid(), self.opened, self.hits, self.misses))
+        self.new_entries = []
+        self.used_keys = []
+
+    def close(self):
+        if self.closed:
+            return
+        self.commit()
+        self.connection.close()
+        self.closed = True
+
+
+def cache_report(cache_path, run_start):
+    '''Sums the hits and misses of the connections opened since
+        run_start (by the processes of the run, which have to be
+        closed first). The counts of earlier runs are removed.
+    '''
+    connection = connect(cache_path)
+    hits, misses = connection.execute("SELECT COALESCE(SUM(hits), 0), COALESCE(SUM(misses), 0) FROM lookups "
+                                      "WHERE opened >= ?", (run_start,)).fetchone()
+    with connection:
+        connection.execute("DELETE FROM lookups WHERE opened < ?", (run_start,))
+    connection.close()
+    return hits, misses
+
+
+def evict(cache_path, max_bytes):
+    '''Removes the least recently used entries until the cached
+        values take at most max_bytes. Returns the number of
+        removed entries.
+    '''
+    connection = connect(cache_path)
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cleaned").fetchone()[0]
+    if total <= max_bytes:
+        connection.close()
+        return 0
+    removed_keys = []
+    for key, size in connection.execute("SELECT key, size FROM cleaned ORDER BY last_used"):
+        if total <= max_bytes:
+            break
+        removed_keys.append((key,))
+        total -= size
+    with connection:
+        connection.executemany("DELETE FROM cleaned WHERE key = ?", removed_keys)
+    connection.close()
+    return len(removed_keys)
@@ -0,0 +1,165 @@
+'''This file contains an index for looking up single biographies
+    of a saved corpus without loading its files. The index is a
+    SQLite database next to the corpus, e.g.
+    wiki_data/enwiki.index.sqlite, with the file, byte offset and
+    length of every biography by page id, title and every name in
+    names. A lookup is one query and one read of the biography.
+
+    Only uncompressed json and jsonl corpora can be indexed,
+    compressed and parquet files can not be read at a byte offset.
+    They can be converted first with main.py --merge-to.
+'''
+
+import json
+import os
+import sqlite3
+from corpus_reader import corpus_prefix, find_corpus_files
+
+# Biographies inserted into the index at once.
+INSERT_BATCH_SIZE = 10000
+
+
+def index_path(save_path):
+    '''wiki_data/enwiki.json -> wiki_data/enwiki.index.sqlite
+    '''
+    return corpus_prefix(save_path) + ".index.sqlite"
+
+
+def iterate_record_spans(path):
+    '''Yields (record, offset, length) for every biography in an
+        uncompressed corpus file, with the offset and length in bytes.
+    '''
+    if path.endswith(".jsonl"):
+        with open(path, "rb") as lines_file:
+            offset = 0
+            for line in lines_file:
+                record_line = line.rstrip(b"\r\n")
+                if record_line.strip():
+                    yield json.loads(record_line), offset, len(record_line)
+                offset += len(line)
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as json_file:
+            content = json_file.read()
+        decoder = json.JSONDecoder()
+        # The byte offset of position in content.
+        position = content.index("[") + 1
+        offset = len(content[:position].encode("utf-8"))
+        while True:
+            start = skip_whitespace(content, position)
+            if content[start] == "]":
+                return
+            record, end = decoder.raw_decode(content, start)
+            offset += len(content[position:start].encode("utf-8"))
+            length = len(content[start:end].encode("utf-8"))
+            yield record, offset, length
+            offset += length
+            position = skip_whitespace(content, end)
+            if content[position] == ",":
+                position += 1
+            offset += len(content[end:position].encode("utf-8"))
+    else:
+        raise ValueError("Only uncompressed json and jsonl files can be indexed, not " + path)
+
+
+def skip_whitespace(content, position):
+    while content[position] in " \t\r\n":
+        position += 1
+    return position
+
+
+def build_corpus_index(save_path):
+    '''Builds the index of the corpus at save_path and returns its
+        path. An existing index is replaced.
+    '''
+    path = index_path(save_path)
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        "CREATE TABLE files (number INTEGER PRIMARY KEY, path TEXT, size INTEGER, mtime_ns INTEGER);"
+        "CREATE TABLE biographies (id TEXT PRIMARY KEY, title TEXT, file INTEGER, offset INTEGER, length INTEGER);"
+        "CREATE TABLE names (name TEXT, id TEXT);")
+    nr_biographies = 0
+    with connection:
+        for file_number, corpus_file in enumerate(find_corpus_files(save_path)):
+            print("Indexing: " + corpus_file)
+            file_stat = os.stat(corpus_file)
+            connection.execute("INSERT INTO files VALUES (?, ?, ?, ?)",
+                               (file_number, os.path.abspath(corpus_file), file_stat.st_size, file_stat.st_mtime_ns))
+            biographies = []
+            names = []
+            for record, offset, length in iterate_record_spans(corpus_file):
+                page_id = str(record["id"])
+                biographies.append((page_id, record["title"], file_number, offset, length))
+                names.extend((name, page_id) for name in set(record["names"]))
+                if len(biographies) >= INSERT_BATCH_SIZE:
+                    nr_biographies += insert_biographies(connection, biographies, names)
+                    biographies = []
+                    names = []
+            nr_biographies += insert_biographies(connection, biographies, names)
+        connection.execute("CREATE INDEX biographies_title ON biographies (title)")
+        connection.execute("CREATE INDEX names_name ON names (name)")
+    connection.close()
+    print("Indexed {} biographies at: {}".format(nr_biographies, path))
+    return path
+
+
+def insert_biographies(connection, biographies, names):
+    connection.executemany("INSERT OR REPLACE INTO biographies VALUES (?, ?, ?, ?, ?)", biographies)
+    connection.executemany("INSERT INTO names VALUES (?, ?)", names)
+    return len(biographies)
+
+
+class CorpusIndex:
+    '''Looks up biographies in the corpus at save_path with its
+        index. The corpus files are kept open. Raises ValueError if
+        a file changed after the index was built.
+    '''
+
+    def __init__(self, save_path):
+        path = index_path(save_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError("No index found at {}, build it with main.py --build-index".format(path))
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.files = {}
+        for file_number, corpus_file, size, mtime_ns in self.connection.execute("SELECT * FROM files"):
+            file_stat = os.stat(corpus_file)
+            if file_stat.st_size != size or file_stat.st_mtime_ns != mtime_ns:
+                raise ValueError("{} changed after the index was built, build it again".format(corpus_file))
+            self.files[file_number] = os.open(corpus_file, os.O_RDONLY)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, file_number, offset, length):
+        return json.loads(os.pread(self.files[file_number], length, offset))
+
+    def by_id(self, page_id):
+        '''The biography with page_id or None.
+        '''
+        row = self.connection.execute("SELECT file, offset, length FROM biographies WHERE id = ?",
+                                      (str(page_id),)).fetchone()
+        return None if row is None else self.read(*row)
+
+    def by_title(self, title):
+        '''The biography with the title or None.
+        '''
+        row = self.connection.execute("SELECT file, offset, length FROM biographies WHERE title = ?",
+                                      (title,)).fetchone()
+        return None if row is None else self.read(*row)
+
+    def by_name(self, name):
+        '''The biographies that have name in their names.
+        '''
+        rows = self.connection.execute("SELECT file, offset, length FROM names JOIN biographies USING (id) "
+                                       "WHERE name = ? ORDER BY file, offset", (name,)).fetchall()
+        return [self.read(*row) for row in rows]
+
+    def close(self):
+        for file_descriptor in self.files.values():
+            os.close(file_descriptor)
+        self.files = {}
+        self.connection.close()
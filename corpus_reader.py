@@ -0,0 +1,119 @@
+'''This file contains the functions for reading a saved corpus,
+    in any of the output formats of output_writers.py. A corpus is
+    given by the save path of the extraction, e.g.
+    wiki_data/enwiki-20230401.json for the files
+    wiki_data/enwiki-20230401_0.json, wiki_data/enwiki-20230401_1.json, ...
+    or ..._0.jsonl.gz, ..._0.parquet and so on.
+
+    Only parquet files are actually read column by column. For the
+    json formats the whole file is parsed and the columns are
+    selected afterwards. The length column (number of characters of
+    the text) is computed when it is not in the file, other missing
+    columns (e.g. revision_id of a corpus without revisions) are
+    empty.
+'''
+
+import glob
+import gzip
+import json
+import re
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CORPUS_EXTENSIONS = (".parquet", ".jsonl", ".jsonl.gz", ".jsonl.zst", ".json")
+COLUMNS = ["id", "title", "names", "categories", "text", "length"]
+
+
+def corpus_prefix(save_path):
+    '''wiki_data/enwiki.json -> wiki_data/enwiki
+    '''
+    return save_path.replace(".parquet", "").replace(".jsonl", "").replace(".json", "")
+
+
+def find_corpus_files(save_path, nr_files=None):
+    '''Returns the files of the corpus in order. Uses the first
+        format in CORPUS_EXTENSIONS that has files. nr_files
+        limits the result to the first nr_files files.
+    '''
+    prefix = corpus_prefix(save_path)
+    for extension in CORPUS_EXTENSIONS:
+        file_pattern = re.compile(re.escape(prefix) + r'_([0-9]+)' + re.escape(extension) + '$')
+        numbered_files = []
+        for path in glob.glob(glob.escape(prefix) + "_*" + extension):
+            match = file_pattern.match(path)
+            if match:
+                numbered_files.append((int(match.group(1)), path))
+        if numbered_files:
+            paths = [path for number, path in sorted(numbered_files)]
+            return paths[:nr_files] if nr_files is not None else paths
+    raise FileNotFoundError("No corpus files found for " + save_path)
+
+
+def read_corpus_file(path, columns=None):
+    '''Reads one corpus file into a DataFrame with the given
+        columns (default all of COLUMNS).
+    '''
+    if columns is None:
+        columns = COLUMNS
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise ImportError("Reading parquet needs the pyarrow package (pip install pyarrow)")
+        file_columns = pq.read_schema(path).names
+        df = pq.read_table(path, columns=[column for column in columns if column in file_columns]).to_pandas()
+        return df.reindex(columns=columns)
+    if path.endswith(".json"):
+        df = pd.read_json(path, dtype=False)
+    else:
+        df = pd.read_json(path, lines=True, dtype=False)
+    if "length" in columns:
+        df["length"] = df["text"].str.len() if len(df) else pd.Series(dtype="int64")
+    return df.reindex(columns=columns)
+
+
+def iterate_file_records(path, columns):
+    '''Yields a tuple with the values of columns for every
+        biography in one corpus file. Parquet files are read in
+        row groups and jsonl files line by line, a json file has
+        to be loaded as a whole. Columns that are not in the file
+        are None.
+    '''
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise ImportError("Reading parquet needs the pyarrow package (pip install pyarrow)")
+        parquet_file = pq.ParquetFile(path)
+        file_columns = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(columns=file_columns):
+            missing = [None] * batch.num_rows
+            yield from zip(*(batch.column(column).to_pylist() if column in file_columns else missing
+                             for column in columns))
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as json_file:
+            for record in json.load(json_file):
+                yield tuple(record.get(column) for column in columns)
+    else:
+        with open_corpus_lines(path) as lines_file:
+            for line in lines_file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(record.get(column) for column in columns)
+
+
+def open_corpus_lines(path):
+    '''Opens a (compressed) jsonl file for reading text.
+    '''
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("Reading zstd files needs the zstandard package (pip install zstandard)")
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
@@ -0,0 +1,157 @@
+'''This file contains the engine for the global counts of
+    basic_statistics.py. Every file of the corpus is counted on
+    its own, streaming the records (see corpus_reader.py), and
+    the files are spread over a pool of processes. The counts of
+    the files are CorpusCounts, which are merged with +.
+
+    The number of words is the same as len(re.split('\\s+', text))
+    in the original implementation, but counted with str.split.
+    Chinese texts are segmented with jieba, which is much slower
+    than reading the corpus. For Chinese the records are read in
+    this process and only the texts are sent, in batches, to the
+    workers (each loads the jieba dictionary once). The word
+    counts can be kept in a WordCountCache so the next run only
+    segments the new and changed articles.
+'''
+
+import collections
+import functools
+import os
+from dataclasses import dataclass
+from corpus_reader import find_corpus_files, iterate_file_records
+from parallel import ordered_imap, chunked
+from word_count_cache import WordCountCache
+
+# Texts sent to a worker at once for segmenting.
+SEGMENT_BATCH_SIZE = 200
+
+
+@dataclass
+class CorpusCounts:
+    biographies: int = 0
+    words: int = 0
+    chars: int = 0
+    categories: int = 0
+    size: int = 0
+
+    def __add__(self, other):
+        return CorpusCounts(self.biographies + other.biographies, self.words + other.words,
+                            self.chars + other.chars, self.categories + other.categories,
+                            self.size + other.size)
+
+
+def is_chinese(language):
+    return (language == "zh") or (language == "chinese")
+
+
+def initialize_segmenter():
+    '''Initializer of the workers, loads the jieba dictionary.
+    '''
+    import jieba
+    jieba.initialize()
+
+
+def count_segmented_words(texts):
+    '''Runs in the worker. Word counts of a batch of Chinese texts.
+    '''
+    import jieba
+    return [len(list(jieba.cut(text, cut_all=False))) for text in texts]
+
+
+def count_words(text, language):
+    '''Chinese don't seperate words with spaces so jieba is
+        required to split into words. For the other languages
+        this is len(re.split('\\s+', text)), which also counts the
+        empty strings before/after whitespace at the start/end.
+    '''
+    if is_chinese(language):
+        return count_segmented_words([text])[0]
+    if not text:
+        return 1
+    return len(text.split()) + text[0].isspace() + text[-1].isspace()
+
+
+def count_file(path, language, count_categories=True):
+    '''Counts one corpus file. Without count_categories the
+        categories are not read and counted as 0.
+    '''
+    counts = CorpusCounts(size=os.path.getsize(path))
+    columns = ["text", "categories"] if count_categories else ["text"]
+    for record in iterate_file_records(path, columns):
+        text = record[0]
+        counts.biographies += 1
+        counts.words += count_words(text, language)
+        counts.chars += len(text)
+        if count_categories:
+            counts.categories += len(record[1])
+    return counts
+
+
+def iterate_chinese_word_counts(records, workers=1, cache=None):
+    '''Yields the word counts of the (page_id, text) records in
+        order. The texts that are not in the cache are segmented in
+        batches by workers processes.
+    '''
+    # Per batch the counts with None for the texts sent to the workers
+    # and those records, in the order the batches are sent.
+    batches = collections.deque()
+
+    def texts_to_segment():
+        for batch in chunked(records, SEGMENT_BATCH_SIZE):
+            word_counts = [None if cache is None else cache.get(page_id, text) for page_id, text in batch]
+            missing = [record for record, words in zip(batch, word_counts) if words is None]
+            batches.append((word_counts, missing))
+            yield [text for page_id, text in missing]
+
+    for segmented in ordered_imap(count_segmented_words, texts_to_segment(), workers,
+                                  initializer=initialize_segmenter):
+        word_counts, missing = batches.popleft()
+        if cache is not None:
+            for (page_id, text), words in zip(missing, segmented):
+                cache.put(page_id, text, words)
+        segmented = iter(segmented)
+        for words in word_counts:
+            yield next(segmented) if words is None else words
+
+
+def count_corpus(save_path, language, nr_files=None, workers=1, word_count_cache=None, count_categories=True):
+    '''Counts the corpus at save_path with workers processes.
+        word_count_cache is the path of the WordCountCache for
+        Chinese. Without count_categories (e.g. when they are taken
+        from the category index) the categories are not read.
+    '''
+    if is_chinese(language):
+        return count_chinese_corpus(save_path, nr_files, workers, word_count_cache, count_categories)
+    counts = CorpusCounts()
+    count = functools.partial(count_file, language=language, count_categories=count_categories)
+    for file_counts in ordered_imap(count, find_corpus_files(save_path, nr_files), workers):
+        counts += file_counts
+    return counts
+
+
+def count_chinese_corpus(save_path, nr_files=None, workers=1, word_count_cache=None, count_categories=True):
+    '''Counts the Chinese corpus at save_path, the records are read
+        here and the texts segmented by workers processes.
+    '''
+    counts = CorpusCounts()
+    columns = ["id", "text", "categories"] if count_categories else ["id", "text"]
+
+    def records():
+        for path in find_corpus_files(save_path, nr_files):
+            counts.size += os.path.getsize(path)
+            for record in iterate_file_records(path, columns):
+                page_id, text = record[:2]
+                counts.biographies += 1
+                counts.chars += len(text)
+                if count_categories:
+                    counts.categories += len(record[2])
+                yield page_id, text
+
+    cache = None if word_count_cache is None else WordCountCache(word_count_cache)
+    try:
+        counts.words = sum(iterate_chinese_word_counts(records(), workers, cache))
+    finally:
+        if cache is not None:
+            cache.close()
+            print("Word count cache: {} hits, {} misses".format(cache.hits, cache.misses))
+    return counts
@@ -0,0 +1,338 @@
+'''Small dumps for the benchmarks (benchmark.py --suite).
+    A synthetic dump is generated from the regex_patterns of a
+    language: biographies with the category links (or infobox
+    fields) of biography_identifying_rules, other pages, redirects,
+    and the constructs the cleaning removes (templates, infoboxes,
+    refs, comments, tables, galleries, files, headings, links and
+    the references sections). The same seed gives the same dump.
+    A sampled dump has random pages of a real dump.
+    SyntheticDumpStream is a synthetic dump of any size that is
+    generated while it is read, e.g. for the memory benchmark.
+
+    Example usage:
+    Synthetic
+    python dump_fixtures.py synthetic -s fixtures/english.xml -l english -n 10000
+
+    Sampled from a real dump
+    python dump_fixtures.py sample -p dumps/enwiki-20221220ms24.xml -s fixtures/english_sample.xml -n 10000
+'''
+
+import bz2
+import io
+import random
+import re
+from argparse import ArgumentParser
+from xml.sax.saxutils import escape
+from multistream import open_dump
+from page_scanner import iterate_file_page_spans
+from regex_patterns import regex_patterns_by_language
+
+
+ARG_PARSER = ArgumentParser(
+    description=("Example usage: \n "
+                 "python dump_fixtures.py synthetic -s fixtures/english.xml -l english -n 10000")
+)
+
+ARG_PARSER.add_argument(
+    "command",
+    choices=["synthetic", "sample"],
+)
+
+ARG_PARSER.add_argument(
+    "-p",
+    "--wiki-dump-path",
+    default=None,
+    help=(
+        "Path to the dump the pages are sampled from (sample only)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-s",
+    "--save-path",
+    required=True,
+    help=(
+        "Where the dump is saved, compressed with bz2 if it ends with .bz2."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-l",
+    "--language",
+    default="english",
+    help=(
+        "Language of the synthetic dump (synthetic only)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-n",
+    "--nr-pages",
+    default=10000,
+    help=(
+        "Number of pages in the dump."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--seed",
+    default=0,
+)
+
+ARG_PARSER.add_argument(
+    "--biography-share",
+    default=0.4,
+    help=(
+        "Share of the synthetic pages that are biographies (synthetic only)."
+    ),
+)
+
+DUMP_HEADER = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" '
+               'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" version="0.10" xml:lang="{}">\n'
+               '  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n')
+DUMP_FOOTER = '</mediawiki>\n'
+PAGE = ('  <page>\n    <title>{title}</title>\n    <ns>0</ns>\n    <id>{page_id}</id>\n{redirect}'
+        '    <revision>\n      <id>{revision_id}</id>\n      <timestamp>2023-01-01T00:00:00Z</timestamp>\n'
+        '      <contributor>\n        <username>Bot</username>\n        <id>1</id>\n      </contributor>\n'
+        '      <model>wikitext</model>\n      <format>text/x-wiki</format>\n'
+        '      <text bytes="{length}" xml:space="preserve">{text}</text>\n'
+        '    </revision>\n  </page>\n')
+
+LANGUAGE_CODES = {"english": "en", "swedish": "sv", "russian": "ru", "persian": "fa", "chinese": "zh"}
+LETTERS = {
+    "english": "abcdefghijklmnopqrstuvwxyz",
+    "swedish": "abcdefghijklmnopqrstuvwxyzåäö",
+    "russian": "абвгдеёжзийклмнопрстуфхцчшщыэюя",
+    "persian": "ابپتثجچحخدذرزژسشصضطظعغفقکگلمنوهی",
+    "chinese": "".join(chr(code) for code in range(0x4e00, 0x4e00 + 2000)),
+}
+
+
+def open_dump_for_writing(save_path):
+    if save_path.endswith(".bz2"):
+        return bz2.open(save_path, "wt", encoding="utf-8")
+    return open(save_path, "w", encoding="utf-8")
+
+
+def vocab_word(pattern):
+    '''A word matched by a pattern of cleaning_vocab, e.g.
+        "External [Ll]inks" -> "External Links".
+    '''
+    return re.sub(r'\[(.)[^\]]*\]', r'\1', pattern.split("|")[0])
+
+
+class SyntheticPages:
+    '''Generates the wikitext of synthetic pages of a language.
+    '''
+
+    def __init__(self, language, seed=0):
+        patterns = regex_patterns_by_language[language]
+        self.vocab = {key: vocab_word(value) for key, value in patterns["cleaning_vocab"].items()}
+        self.rules = patterns["biography_identifying_rules"]
+        self.letters = LETTERS[language]
+        self.random = random.Random(seed)
+
+    def word(self):
+        return "".join(self.random.choice(self.letters) for _ in range(self.random.randint(2, 9)))
+
+    def words(self, number):
+        return " ".join(self.word() for _ in range(number))
+
+    def paragraph(self):
+        '''A paragraph with links, bold text, refs and the odd comment.
+        '''
+        parts = []
+        for _ in range(self.random.randint(3, 8)):
+            sentence = self.words(self.random.randint(5, 15))
+            kind = self.random.random()
+            if kind < 0.3:
+                sentence += " [[{}]]".format(self.words(2))
+            elif kind < 0.5:
+                sentence += " [[{}|{}]]".format(self.words(2), self.words(1))
+            elif kind < 0.6:
+                sentence += "<ref>{{{{cite web |url=http://example.com/{} |title={}}}}}</ref>".format(
+                    self.word(), self.words(3))
+            elif kind < 0.65:
+                sentence += "<!-- {} -->".format(self.words(4))
+            elif kind < 0.7:
+                sentence += " ({{{{lang|xx|{}}}}})".format(self.word())
+            parts.append(sentence + ".")
+        return " ".join(parts)
+
+    def infobox(self, biography):
+        '''An infobox with many fields, the biographies of languages
+            identified by infobox fields get one of them.
+        '''
+        fields = ["{} = {}".format(self.word(), self.words(self.random.randint(1, 4)))
+                  for _ in range(self.random.randint(5, 30))]
+        fields.append("image = {}.jpg".format(self.word()))
+        fields.append("date = {{{{birth date|19{:02d}|1|1}}}}".format(self.random.randint(0, 99)))
+        if biography and self.rules.get("fields"):
+            fields.append("{} = {}".format(self.random.choice(self.rules["fields"]), self.words(2)))
+        return "{{Infobox " + self.word() + "\n| " + "\n| ".join(fields) + "\n}}\n"
+
+    def biography_link(self):
+        '''A category link (or template) of biography_identifying_rules.
+        '''
+        prefix, start, line_contains = self.random.choice(self.rules["links"])
+        closing = "}}" if prefix.startswith("{{") else "]]"
+        link = prefix + start
+        if not start:
+            link += "19{:02d} ".format(self.random.randint(0, 99))
+        if line_contains is not None:
+            link += line_contains
+        if not link.endswith(closing):
+            link += closing
+        return link
+
+    def text(self, biography, name, paragraphs):
+        parts = []
+        if self.random.random() < 0.8:
+            parts.append(self.infobox(biography))
+        parts.append("'''{}''' {}\n".format(name, self.paragraph()))
+        for _ in range(paragraphs):
+            parts.append("\n== {} ==\n{}\n".format(self.words(2), self.paragraph()))
+            kind = self.random.random()
+            if kind < 0.2:
+                parts.append('{{| class="wikitable"\n|-\n! {} !! {}\n|-\n| {} || {}\n|}}\n'.format(
+                    self.word(), self.word(), self.words(2), self.words(2)))
+            elif kind < 0.3:
+                parts.append("<gallery>\n{}:{}.jpg|{}\n{}:{}.jpg|{}\n</gallery>\n".format(
+                    self.vocab["file"], self.word(), self.words(2), self.vocab["file"], self.word(), self.words(2)))
+            elif kind < 0.5:
+                parts.append("[[{}:{}.jpg|thumb|{} [[{}]]]]\n".format(
+                    self.vocab["file"], self.word(), self.words(3), self.word()))
+            elif kind < 0.55:
+                parts.append("* {}\n* [http://example.com/{} {}]\n".format(self.words(4), self.word(), self.word()))
+        parts.append("\n== {} ==\n{{{{reflist}}}}\n".format(self.vocab["references"]))
+        parts.append("\n== {} ==\n* [http://example.com {}]\n".format(self.vocab["external links"], self.words(2)))
+        if biography:
+            links = [self.biography_link() for _ in range(self.random.randint(1, 3))]
+        else:
+            links = []
+        links += ["[[{}:{}]]".format(self.vocab["category"], self.words(2)) for _ in range(self.random.randint(0, 4))]
+        parts.append("\n" + "\n".join(links) + "\n")
+        return "".join(parts)
+
+
+    def page(self, biography_share=0.4, redirect_share=0.1, paragraphs=5):
+        '''(title, redirect, text, length) of a random page, escaped
+            for the xml. redirect is the <redirect> line of a redirect
+            or "", length the bytes of the text.
+        '''
+        title = self.words(2)
+        if self.random.random() < redirect_share:
+            text = "#REDIRECT [[{}]]".format(self.words(2))
+            redirect = '    <redirect title="{}" />\n'.format(escape(self.words(2), {'"': "&quot;"}))
+        else:
+            biography = self.random.random() < biography_share
+            text = self.text(biography, title, self.random.randint(1, 2 * paragraphs - 1))
+            redirect = ""
+        return escape(title), redirect, escape(text), len(text.encode("utf-8"))
+
+
+def page_xml(page, page_id):
+    title, redirect, text, length = page
+    return PAGE.format(title=title, page_id=page_id, redirect=redirect, revision_id=page_id + 999999,
+                       length=length, text=text)
+
+
+def write_synthetic_dump(save_path, nr_pages, language="english", seed=0, biography_share=0.4, redirect_share=0.1,
+                         paragraphs=5):
+    '''Writes a dump of nr_pages synthetic pages of language.
+        About biography_share of them are biographies and
+        redirect_share redirects. paragraphs is the average
+        number of sections of a page.
+    '''
+    pages = SyntheticPages(language, seed)
+    with open_dump_for_writing(save_path) as dump_file:
+        dump_file.write(DUMP_HEADER.format(LANGUAGE_CODES.get(language, "en")))
+        for page_number in range(nr_pages):
+            dump_file.write(page_xml(pages.page(biography_share, redirect_share, paragraphs), page_number + 1))
+        dump_file.write(DUMP_FOOTER)
+    print("Saved {} synthetic {} pages at: {}".format(nr_pages, language, save_path))
+
+
+class SyntheticDumpStream(io.RawIOBase):
+    '''A binary file with a synthetic dump of about nr_bytes bytes,
+        generated while it is read. distinct_pages pages are
+        generated once and repeated with new page ids, so a dump of
+        many GB is read at the speed of the parser.
+    '''
+
+    def __init__(self, nr_bytes, language="english", seed=0, distinct_pages=1000, biography_share=0.4):
+        pages = SyntheticPages(language, seed)
+        self.pages = [pages.page(biography_share) for _ in range(distinct_pages)]
+        self.nr_bytes = nr_bytes
+        self.bytes_read = 0
+        self.nr_pages = 0
+        self.buffer = DUMP_HEADER.format(LANGUAGE_CODES.get(language, "en")).encode("utf-8")
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        parts = [self.buffer]
+        buffered = len(self.buffer)
+        while buffered < len(target) and not self.finished:
+            if self.bytes_read + buffered >= self.nr_bytes:
+                parts.append(DUMP_FOOTER.encode("utf-8"))
+                self.finished = True
+            else:
+                page = self.pages[self.nr_pages % len(self.pages)]
+                self.nr_pages += 1
+                parts.append(page_xml(page, self.nr_pages).encode("utf-8"))
+            buffered += len(parts[-1])
+        self.buffer = b"".join(parts)
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        self.bytes_read += size
+        return size
+
+
+def write_sampled_dump(xml_path, save_path, nr_pages, seed=0):
+    '''Writes nr_pages random pages of the dump at xml_path, in
+        dump order and with the header of the dump. The pages are
+        sampled in one pass with reservoir sampling.
+    '''
+    random_generator = random.Random(seed)
+    reservoir = []
+    header = None
+    nr_read = 0
+    with open_dump(xml_path) as dump_file:
+        for buffer, start, end, buffer_position in iterate_file_page_spans(dump_file):
+            if header is None:
+                header = bytes(buffer[:start])
+            # Algorithm R, see json_operations.sample_from_multiple_json.
+            if nr_read < nr_pages:
+                reservoir.append((nr_read, bytes(buffer[start:end])))
+            else:
+                position = random_generator.randrange(nr_read + 1)
+                if position < nr_pages:
+                    reservoir[position] = (nr_read, bytes(buffer[start:end]))
+            nr_read += 1
+    reservoir.sort(key=lambda item: item[0])
+    opener = bz2.open if save_path.endswith(".bz2") else open
+    with opener(save_path, "wb") as sample_file:
+        sample_file.write(header or DUMP_HEADER.format("en").encode("utf-8"))
+        for number, page in reservoir:
+            sample_file.write(b"  " + page + b"\n")
+        sample_file.write(DUMP_FOOTER.encode("utf-8"))
+    print("Saved {} of {} pages at: {}".format(len(reservoir), nr_read, save_path))
+
+
+def main():
+    args = ARG_PARSER.parse_args()
+    if args.command == "synthetic":
+        write_synthetic_dump(args.save_path, int(args.nr_pages), args.language, int(args.seed),
+                             float(args.biography_share))
+    else:
+        if args.wiki_dump_path is None:
+            ARG_PARSER.error("sample needs the dump to sample from (-p)")
+        write_sampled_dump(args.wiki_dump_path, args.save_path, int(args.nr_pages), int(args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+'''This file reads the configurations for extracting several
+    corpora from one dump in a single pass (main.py --configs).
+    The configurations are a json file with one entry per corpus:
+
+    {
+        "zh_categories": {
+            "save_path": "wiki_data/zh_categories.json",
+            "language": "chinese",
+            "biography_identifying_regex": "\\[\\[(Category|分类|分類):(在世人物|.*逝世|.*出生)"
+        },
+        "zh_bd_template": {
+            "save_path": "wiki_data/zh_bd.json",
+            "language": "chinese",
+            "biography_identifying_regex": "\\{\\{bd\\|.*\\}\\}",
+            "min_characters": 500
+        }
+    }
+
+    save_path is required. language, min_characters and
+    cleaning_engine default to the arguments of main.py and
+    biography_identifying_regex to the regex of the language.
+'''
+
+import json
+import re
+from biography_classifier import get_biography_identifier
+
+CONFIG_KEYS = {"save_path", "language", "biography_identifying_regex", "min_characters", "cleaning_engine"}
+
+
+def load_extraction_configs(config_path, language="english", min_characters=0, cleaning_engine="pipeline",
+                            identifier="rules"):
+    '''Returns the configurations in config_path as a list of
+        dicts with all keys set and the regex compiled. Without
+        a biography_identifying_regex the identifier of the
+        language is used, see biography_classifier.py.
+    '''
+    with open(config_path, encoding="utf-8") as config_file:
+        named_configs = json.load(config_file)
+
+    configs = []
+    for name, config in named_configs.items():
+        unknown_keys = set(config) - CONFIG_KEYS
+        if unknown_keys:
+            raise ValueError("Unknown keys {} in the configuration {}".format(sorted(unknown_keys), name))
+        if "save_path" not in config:
+            raise ValueError("The configuration {} has no save_path".format(name))
+        config_language = config.get("language", language)
+        if "biography_identifying_regex" in config:
+            biography_identifier = re.compile(config["biography_identifying_regex"])
+        else:
+            biography_identifier = get_biography_identifier(config_language, identifier)
+        configs.append({"name": name,
+                        "save_path": config["save_path"],
+                        "language": config_language,
+                        "biography_identifying_regex": biography_identifier,
+                        "min_characters": int(config.get("min_characters", min_characters)),
+                        "cleaning_engine": config.get("cleaning_engine", cleaning_engine)})
+
+    save_paths = [config["save_path"] for config in configs]
+    if len(set(save_paths)) != len(save_paths):
+        raise ValueError("Every configuration needs its own save_path")
+    return configs
+
+
+def combined_identifying_regex(configs):
+    '''One regex that matches if any of the configurations does,
+        used to throw away the other pages while reading the dump.
+        Built from the regexes also for configurations that use
+        the rules.
+    '''
+    return re.compile("|".join("(?:{})".format(config["biography_identifying_regex"].pattern)
+                               for config in configs))
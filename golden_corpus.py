@@ -0,0 +1,187 @@
+'''Golden-output corpus for the cleaning engines.
+    A golden corpus is a json lines file with sampled biographies
+    from a dump, their raw text and the output of
+    process_text_reference. It is used to check that an
+    alternative cleaning engine gives the same output.
+
+    Example usage:
+    Building
+    python golden_corpus.py build -p dumps/enwiki-20221220ms24.xml -s golden/english.jsonl -l english -n 1000
+
+    Checking
+    python golden_corpus.py check -s golden/english.jsonl -l english --cleaning-engine single_pass
+
+    The check exits with status 1 if any output differs.
+'''
+
+import json
+import random
+import re
+import sys
+from argparse import ArgumentParser
+from multistream import open_dump
+from page_scanner import scan_dump
+from regex_patterns import regex_patterns_by_language
+from template_stripper import TemplateStripper, strip_templates_mwp
+from text_processing import process_text_reference, get_cleaning_pipeline, CLEANING_ENGINES
+
+# Malformed wikitext the template stripping of the single_pass engine
+# has to leave to mwparserfromhell. Checked together with the golden
+# corpus, as a sample of a dump rarely has them.
+MALFORMED_TEMPLATE_SNIPPETS = [
+    "</nowiki>{{<ref name=a/>}}",
+    "Text <nowiki>== h ==={{a|b}}[[a|{{b}}]]\n",
+    "== h ==={{a|b}} text\n",
+    "{{lang|fr|x}}<pre>{{t}} unclosed\n",
+    "<ref></nowiki>{{t}}</ref>",
+    "<nowiki><nowiki>{{</nowiki>{{lang|fr|x}}</nowiki>",
+    "<ref><pre></ref>== {{h}} ==</pre>",
+    "[[{{t|1}}<small>{{s}}</small>]]",
+    "[[{{lang|fr|x}}{{<ref name=a/>}}]]",
+    "<ref>{{t|1}}''</ref>''",
+    "word {{]]}}",
+    "<pre>\n{| class=\"wikitable\"\n</pre>{{a|b}}",
+    "</span>[http://a{{==}}[http://a|}",
+    "x=]{|]a=[http://a[http://a{{==}}<ref><br>",
+    "<br>a[http://a ==<ref></ref>{{==}}<ref>}}{|]==</ref>",
+    "<span>{{x='''|}|}'''<}}",
+    "<ref>{{a}}</span></ref>",
+    "<ref><!--<ref>-->{{==}}</ref>",
+    "<ref><!--{{a}}</ref>",
+    "'''{{==}}<!--'''-->",
+]
+
+
+ARG_PARSER = ArgumentParser(
+    description=("Example usage: \n "
+                 "python golden_corpus.py build -p dumps/enwiki-20221220ms24.xml -s golden/english.jsonl -l english")
+)
+
+ARG_PARSER.add_argument(
+    "command",
+    choices=["build", "check"],
+)
+
+ARG_PARSER.add_argument(
+    "-p",
+    "--wiki-dump-path",
+    default=None,
+    help=(
+        "Path to the dump the biographies are sampled from (build only)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-s",
+    "--golden-path",
+    default="golden.jsonl",
+    help=(
+        "Where the golden corpus is saved/read."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "-l",
+    "--language",
+    default="english",
+)
+
+ARG_PARSER.add_argument(
+    "-n",
+    "--nr-articles",
+    default=1000,
+    help=(
+        "Number of biographies to sample (build only)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--seed",
+    default=0,
+)
+
+ARG_PARSER.add_argument(
+    "--cleaning-engine",
+    default="single_pass",
+    choices=list(CLEANING_ENGINES),
+    help=(
+        "The engine to check against the golden corpus (check only)."
+    ),
+)
+
+
+def build_golden_corpus(xml_path, golden_path, language, nr_articles=1000, seed=0):
+    '''Samples nr_articles biographies uniformly from the dump
+        (reservoir sampling, so the dump is read once) and saves
+        them with the output of process_text_reference.
+    '''
+    biography_regex = re.compile(regex_patterns_by_language[language]["biograpy_identifying_regex"])
+    rng = random.Random(seed)
+    sample = []
+    with open_dump(xml_path) as dump_file:
+        for i, (page_id, title, redirect, text, revision_id, timestamp) in enumerate(scan_dump(dump_file, biography_regex)):
+            if i < nr_articles:
+                sample.append((page_id, title, text))
+            else:
+                j = rng.randint(0, i)
+                if j < nr_articles:
+                    sample[j] = (page_id, title, text)
+
+    with open(golden_path, "w", encoding="utf-8") as golden_file:
+        for page_id, title, text in sample:
+            expected_text, names, categories = process_text_reference(text, language)
+            golden_file.write(json.dumps({"id": page_id, "title": title, "raw_text": text,
+                                          "text": expected_text, "names": names,
+                                          "categories": categories}, ensure_ascii=False) + "\n")
+    print(f"Saved {len(sample)} golden articles to {golden_path}")
+
+
+def check_golden_corpus(golden_path, language, engine="single_pass"):
+    '''Runs the cleaning engine on every article of the golden
+        corpus. Returns the ids of the articles where the output
+        differs from the golden output.
+    '''
+    pipeline = get_cleaning_pipeline(language, engine)
+    mismatching_ids = []
+    total = 0
+    with open(golden_path, encoding="utf-8") as golden_file:
+        for line in golden_file:
+            article = json.loads(line)
+            total += 1
+            text, names, categories = pipeline.clean(article["raw_text"])
+            if (text, names, categories) != (article["text"], article["names"], article["categories"]):
+                mismatching_ids.append(article["id"])
+    print(f"{engine}: {total - len(mismatching_ids)} of {total} articles identical to the golden output")
+    if mismatching_ids:
+        print("Mismatching ids: " + ", ".join(mismatching_ids))
+    if hasattr(pipeline, "template_stripper"):
+        mismatching_ids += check_template_snippets()
+    return mismatching_ids
+
+
+def check_template_snippets():
+    '''Strips the templates of MALFORMED_TEMPLATE_SNIPPETS with the
+        TemplateStripper and with mwparserfromhell. Returns the
+        snippets where the two differ.
+    '''
+    stripper = TemplateStripper()
+    mismatching_snippets = [snippet for snippet in MALFORMED_TEMPLATE_SNIPPETS
+                            if stripper.strip(snippet) != strip_templates_mwp(snippet)]
+    total = len(MALFORMED_TEMPLATE_SNIPPETS)
+    print(f"template stripping: {total - len(mismatching_snippets)} of {total} malformed snippets identical")
+    for snippet in mismatching_snippets:
+        print("Mismatching snippet: " + repr(snippet))
+    return mismatching_snippets
+
+
+def main():
+    args = ARG_PARSER.parse_args()
+    if args.command == "build":
+        build_golden_corpus(args.wiki_dump_path, args.golden_path, args.language,
+                            int(args.nr_articles), int(args.seed))
+    elif check_golden_corpus(args.golden_path, args.language, args.cleaning_engine):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+'''This file contains the incremental extraction against a
+    previous corpus. The corpus has to be extracted with the
+    revision ids (--revisions), then the next dump can be
+    extracted with --previous-corpus pointing to it.
+
+    Pages whose revision id is the same as in the previous corpus
+    are not cleaned again. The worker only returns a marker and
+    the cleaned biography is copied from the previous corpus,
+    which is read one file at a time in the same (page) order.
+
+    When the run is finished a delta with the added, changed and
+    removed biography ids is saved next to the corpus, e.g.
+    wiki_data/enwiki.delta.json.
+'''
+
+import json
+from corpus_reader import corpus_prefix, find_corpus_files, read_corpus_file
+
+RECORD_COLUMNS = ["id", "title", "names", "categories", "text", "revision_id", "timestamp"]
+
+# The revision ids of the previous corpus in a worker process,
+# set once per worker by set_previous_revisions.
+previous_revisions = {}
+
+
+def set_previous_revisions(revisions):
+    '''Initializer of the worker processes.
+    '''
+    global previous_revisions
+    previous_revisions = revisions
+
+
+def is_unchanged(page_id, revision_id):
+    '''Checks if the page was a biography with the same revision
+        in the previous corpus.
+    '''
+    return revision_id is not None and previous_revisions.get(page_id) == revision_id
+
+
+def unchanged_marker(page_id, title):
+    return {"id": page_id, "title": title, "unchanged": True}
+
+
+class PreviousCorpus:
+    '''The previous corpus. Only the ids and revision ids are kept in
+        memory, the biographies are read from the files when they
+        are needed. Keeps the file that was read last.
+    '''
+
+    def __init__(self, save_path):
+        self.paths = find_corpus_files(save_path)
+        self.revisions = {}
+        self.file_numbers = {}
+        for file_number, path in enumerate(self.paths):
+            for page_id, revision_id in read_corpus_file(path, ["id", "revision_id"]).itertuples(index=False):
+                if isinstance(revision_id, str):
+                    self.revisions[str(page_id)] = revision_id
+                self.file_numbers[str(page_id)] = file_number
+        self.loaded_file_number = None
+        self.loaded_records = {}
+
+    def get(self, page_id, title):
+        '''Returns the biography of page_id with the new title.
+        '''
+        file_number = self.file_numbers[page_id]
+        if file_number != self.loaded_file_number:
+            records = read_corpus_file(self.paths[file_number], RECORD_COLUMNS).to_dict("records")
+            self.loaded_records = {str(record["id"]): record for record in records}
+            self.loaded_file_number = file_number
+        record = self.loaded_records[page_id]
+        return {"id": page_id, "title": title, "names": list(record["names"]),
+                "categories": list(record["categories"]), "text": record["text"],
+                "revision_id": record["revision_id"], "timestamp": record["timestamp"]}
+
+
+def delta_path(save_path):
+    '''wiki_data/enwiki.json -> wiki_data/enwiki.delta.json
+    '''
+    return corpus_prefix(save_path) + ".delta.json"
+
+
+def save_delta(save_path, previous_corpus):
+    '''Compares the ids and revisions of the new corpus at save_path
+        with the previous corpus and saves the added, changed and
+        removed ids.
+    '''
+    added = []
+    changed = []
+    new_ids = set()
+    for path in find_corpus_files(save_path):
+        for page_id, revision_id in read_corpus_file(path, ["id", "revision_id"]).itertuples(index=False):
+            page_id = str(page_id)
+            new_ids.add(page_id)
+            if page_id not in previous_corpus.file_numbers:
+                added.append(page_id)
+            elif previous_corpus.revisions.get(page_id) != revision_id:
+                changed.append(page_id)
+    removed = [page_id for page_id in previous_corpus.file_numbers if page_id not in new_ids]
+
+    path = delta_path(save_path)
+    print("Saving delta at: {} ({} added, {} changed, {} removed)".format(
+        path, len(added), len(changed), len(removed)))
+    with open(path, "w", encoding="utf-8") as delta_file:
+        json.dump({"added": added, "changed": changed, "removed": removed}, delta_file)
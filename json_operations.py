@@ -1,68 +1,128 @@
-import json
+import random
 import pandas as pd
-import numpy as np
 from tqdm import tqdm
+from biography import Biography, FIELDS
+from corpus_reader import corpus_prefix, find_corpus_files, iterate_file_records, COLUMNS
+from output_writers import get_output_writer
 
-def combine_json(path_json, save_path, nr_files):
-    '''Combines multiple json files to one.
-    path should be the path to the files except the '_#.json' at the end.
-    E.g. path_json = "wiki_data/enwiki-20230401"
+
+class SeenIds:
+    '''The page ids that were seen. The ids are numbers, which are
+        kept as bits of a bytearray (about 10 MB for all Wikipedia
+        page ids), other ids (anything but plain ascii numbers) in
+        a set.
     '''
-    all_files = []
-    for i in range(nr_files):
-        print(i)
-        with open(path_json + "_" + str(i) + ".json") as json_file:
-            json_data = json.load(json_file)
-            all_files = pd.concat([all_files, json_data])
-        with open(save_path, "w+") as fp:
-            json.dump(all_files, fp=fp)
 
+    def __init__(self):
+        self.bits = bytearray()
+        self.other_ids = set()
+
+    def add(self, page_id):
+        '''Adds page_id and returns True if it was seen before.
+        '''
+        page_id = str(page_id)
+        # Only ids that are the plain decimal form of a number are bits,
+        # otherwise e.g. "07" and "7" or "²" and "2" would be the same id.
+        if not (page_id.isascii() and page_id.isdigit()) or page_id != str(int(page_id)):
+            seen = page_id in self.other_ids
+            self.other_ids.add(page_id)
+            return seen
+        number = int(page_id)
+        byte, bit = divmod(number, 8)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+        seen = bool(self.bits[byte] & (1 << bit))
+        self.bits[byte] |= 1 << bit
+        return seen
+
+
+def merge_corpus(path_json, save_path, output_format="jsonl", max_records=0, max_bytes=None, compression="none",
+                 nr_files=None, deduplicate=True, revisions=False):
+    '''Merges the files of the corpus at path_json (any format of
+        corpus_reader.py) into the corpus at save_path, e.g. the json
+        batches of an extraction into one jsonl file, or repartitions
+        it into files of max_records biographies or max_bytes bytes.
+        max_records=0 writes everything to one file. The biographies
+        are streamed one at a time (json input files are loaded one
+        at a time), and the json output format keeps one output file
+        in memory. With deduplicate only the first biography of every
+        page id is kept. With revisions the revision ids and timestamps
+        are kept too (a corpus extracted with --revisions). Returns the
+        number of written and of duplicate biographies.
+    '''
+    if corpus_prefix(path_json) == corpus_prefix(save_path):
+        raise ValueError("The merged corpus needs another save path than " + path_json)
+    seen_ids = SeenIds()
+    duplicates = 0
+    with get_output_writer(output_format, save_path, max_records or float("inf"), max_bytes, compression) as writer:
+        for path in tqdm(find_corpus_files(path_json, nr_files)):
+            for values in iterate_file_records(path, FIELDS):
+                biography = Biography(*values, revisions=revisions)
+                if deduplicate and seen_ids.add(biography.id):
+                    duplicates += 1
+                    continue
+                writer.write(biography)
+    print("Merged {} biographies, {} duplicates removed".format(writer.total_records, duplicates))
+    return writer.total_records, duplicates
 
-def sample_from_multiple_json(path_json, nr_samples=50000, json_file_size=50000, total_json_files=1, save_path="sample.json"):
+
+def sample_from_multiple_json(path_json, nr_samples=50000, json_file_size=50000, total_json_files=1, save_path="sample.json",
+                              seed=None, min_characters=0, keep=None):
     ''' It requires too much memory to just combine all files into
         one large json. Therefore, we sampple from multiple files and 
         create one sample json.
+        The files can be in any format of corpus_reader.py and are
+        read once, record by record, with reservoir sampling, so only
+        the sample is kept in memory (json_file_size is not used
+        anymore). The sample is drawn without replacement from the
+        biographies with at least min_characters characters for which
+        keep(record) is true (record is a Biography, see biography.py),
+        and is the same for the same seed.
+        Returns the sample in corpus order and the total number of
+        biographies (also those that were filtered out).
     '''
-    last_file = pd.read_json(path_json + "_" + str(total_json_files-1) + ".json")
-    total_biographies = json_file_size*(total_json_files-1) + len(last_file)
-    random_locs = np.random.choice(a=total_biographies, size=nr_samples, replace=True)
-    print(random_locs)
-
-    df = pd.DataFrame(columns = last_file.columns)
+    random_generator = random.Random(seed)
+    columns = ["id", "title", "names", "categories", "text"]
+    reservoir = []
+    total_biographies = 0
+    nr_candidates = 0
+    corpus_files = find_corpus_files(path_json, total_json_files)
+    for path in tqdm(corpus_files):
+        for values in iterate_file_records(path, columns):
+            total_biographies += 1
+            record = Biography(*values)
+            if len(record.text) < min_characters or (keep is not None and not keep(record)):
+                continue
+            # Algorithm R, the n-th candidate replaces a random element
+            # of the reservoir with probability nr_samples / n.
+            if nr_candidates < nr_samples:
+                reservoir.append((total_biographies, record))
+            else:
+                position = random_generator.randrange(nr_candidates + 1)
+                if position < nr_samples:
+                    reservoir[position] = (total_biographies, record)
+            nr_candidates += 1
 
-    for file_id in tqdm(range(total_json_files)):
-        low = file_id * json_file_size
-        high = (file_id + 1) * json_file_size
-        iloc_positions = np.where(np.logical_and(random_locs>=low, random_locs<high))[0]
-        ilocs = random_locs[iloc_positions]
-        ilocs = ilocs - low
-
-        current_file = pd.read_json(path_json + "_" + str(file_id) + ".json")
-        new_df = current_file.iloc[ilocs]
-        df = pd.concat([df, new_df])
-    
-    df = df.reset_index()
-    df = df.drop(columns=["index"])
+    reservoir.sort(key=lambda item: item[0])
+    df = pd.DataFrame([(record.id, record.title, record.names, record.categories, record.text, len(record.text))
+                       for number, record in reservoir], columns=COLUMNS)
     df.to_json(save_path)
     return df, total_biographies
         
 
-def apply_character_threshold(path_json, total_json_files=1, threshold=1000):
-    last_file = pd.read_json(path_json + "_" + str(total_json_files-1) + ".json")
-    df = pd.DataFrame(columns=last_file.columns)
-    for file_id in range(0, total_json_files, 1):
-        print(file_id)
-        current_df = pd.read_json(path_json + "_" + str(file_id) + ".json")
-        current_df["str_len"] = current_df.text.str.len()
-        df = pd.concat([df, current_df[current_df["str_len"]>threshold]])
+def apply_character_threshold(path_json, total_json_files=1, threshold=1000, nr_samples=50000, seed=None,
+                              save_path="shortened.json"):
+    '''Samples nr_samples biographies with more than threshold characters.
+    '''
+    df, total_biographies = sample_from_multiple_json(path_json, nr_samples=nr_samples,
+                                                      total_json_files=total_json_files, save_path=save_path,
+                                                      seed=seed, min_characters=threshold + 1)
     print(df)
-    df = df.reset_index()
-    df = df.sample(50000)
-    df.to_json("shortened.json")
+    return df
 
 
 def main():
-    # combine_json()
+    # merge_corpus(path_json="wiki_data/chinese/zhwiki-20230401.json", save_path="wiki_data/chinese/zhwiki-20230401.jsonl")
     sample_from_multiple_json(path_json="wiki_data/chinese/zhwiki-20230401", total_json_files=2)
     # apply_character_threshold(path_json="wiki_data/chinese/zhwiki-20230401", total_json_files=6, threshold=500)
 
@@ -2,17 +2,51 @@
     Example usage:
     Extracting and cleaning
     python main.py -p dumps/enwiki-20221220ms24.xml -s wiki_data/enwiki-20221220.json -l english
+
+    Extracting with 16 processes
+    python main.py -p dumps/enwiki-20221220ms24.xml -s wiki_data/enwiki-20221220.json -l english --workers 16
     
+    Streaming gzipped json lines, a new file every 1 GB
+    python main.py -p dumps/enwiki-20221220ms24.xml -s wiki_data/enwiki-20221220.json -l english --output-format jsonl --max-bytes 1000000000 --compression gzip
+
+    Extracting only what changed since the corpus of an earlier dump
+    python main.py -p dumps/enwiki-20230401ms24.xml -s wiki_data/enwiki-20230401.json -l english --previous-corpus wiki_data/enwiki-20221220.json
+
+    Extracting several corpora (e.g. different identifying regexes) while reading the dump once
+    python main.py -p dumps/zhwiki-20230401.xml -l chinese --configs configs/chinese.json
+
+    Quarantining biographies over 2 million characters or 30 CPU seconds of cleaning
+    python main.py -p dumps/enwiki-20221220ms24.xml -s wiki_data/enwiki-20221220.json -l english --max-article-characters 2000000 --article-time-budget 30
+
+    Profiling the stages of the extraction
+    python main.py -p dumps/enwiki-20221220ms24.xml -s wiki_data/enwiki-20221220.json -l english --profile profile.json
+
     Statistics
     python main.py --statistics -s enwiki-20221220.json -l english
+
+    Indexing the corpus for looking up biographies by id, title or name
+    python main.py -s wiki_data/enwiki-20221220.json --build-index
+
+    Indexing the categories
+    python main.py -s wiki_data/enwiki-20221220.json --build-category-index
+
+    Merging the json batches into one json lines file
+    python main.py -s wiki_data/enwiki-20221220.json --merge-to wiki_data/enwiki-20221220.jsonl --max-records 0
     
 '''
 
 import re
-from process_xml import process_xml
+from process_xml import process_xml, process_xml_multi
+from extraction_configs import load_extraction_configs
+from biography_classifier import get_biography_identifier, IDENTIFIERS
 from argparse import ArgumentParser
 from regex_patterns import regex_patterns_by_language
 from basic_statistics import basic_statistics
+from json_operations import merge_corpus
+from corpus_index import build_corpus_index
+from category_index import build_category_index
+from text_processing import CLEANING_ENGINES
+from output_writers import OUTPUT_FORMATS, COMPRESSIONS
 
 
 ARG_PARSER = ArgumentParser(
@@ -84,24 +118,281 @@ ARG_PARSER.add_argument(
     ),
 )
 
+ARG_PARSER.add_argument(
+    "-w",
+    "--workers",
+    default=1,
+    help=(
+        "Number of processes used for identifying and cleaning biographies. \n"
+        "The output is the same as with a single process."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--word-count-cache",
+    default=None,
+    help=(
+        "Path of a SQLite file with the word counts of Chinese biographies by id, used by --statistics. \n"
+        "Only new and changed articles are segmented again with jieba."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--parser",
+    default="scan",
+    choices=["scan", "iterparse"],
+    help=(
+        "How the dump is read. scan is a fast byte scanner that skips non-biographies early, \n"
+        "iterparse is the original ElementTree implementation."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--cleaning-engine",
+    default="pipeline",
+    choices=list(CLEANING_ENGINES),
+    help=(
+        "Implementation of the text cleaning. pipeline runs the cleaning steps one after another, \n"
+        "single_pass fuses them into a few passes over the text (see golden_corpus.py)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--output-format",
+    default="json",
+    choices=list(OUTPUT_FORMATS),
+    help=(
+        "json saves json lists of --max-records biographies per file, \n"
+        "jsonl streams one biography per line to the files as they are extracted, \n"
+        "parquet saves the biographies in columns (needs pyarrow)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--max-records",
+    default=50000,
+    help=(
+        "Number of biographies per output file."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--max-bytes",
+    default=None,
+    help=(
+        "Start a new output file after this many bytes (uncompressed). Only for jsonl."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--compression",
+    default="none",
+    choices=list(COMPRESSIONS),
+    help=(
+        "Compression of the output files. For jsonl zstd needs the zstandard package, \n"
+        "for parquet it is the codec of the columns (snappy if none)."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--resume",
+    action="store_true",
+    help=(
+        "Continue an extraction that stopped from its last checkpoint (saved every finished output file). \n"
+        "Has to be run with the same arguments."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--revisions",
+    action="store_true",
+    help=(
+        "Also save the revision id and timestamp of every biography."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--previous-corpus",
+    default=None,
+    help=(
+        "Save path of a corpus of an earlier dump, extracted with --revisions. \n"
+        "Biographies with the same revision are copied from it instead of cleaned again \n"
+        "and the added/changed/removed ids are saved in a delta file."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--cache-path",
+    default=None,
+    help=(
+        "SQLite file where the cleaned texts are cached, e.g. cache/english.sqlite. \n"
+        "Pages with the same text as in an earlier run are not cleaned again."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--max-cache-mb",
+    default=10240,
+    help=(
+        "Maximum size of the cached texts in MB. The least recently used ones are removed after the run."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--max-article-characters",
+    default=None,
+    help=(
+        "Biographies with more characters of wikitext are not cleaned but written to the quarantine file \n"
+        "next to the output (see quarantine.py). No limit by default."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--article-time-budget",
+    default=None,
+    help=(
+        "CPU seconds the cleaning of one biography may take. It is stopped after the first cleaning step \n"
+        "over the budget and the biography is written to the quarantine file. No limit by default."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--configs",
+    default=None,
+    help=(
+        "Json file with several extraction configurations (see extraction_configs.py). \n"
+        "Every configuration is saved to its own corpus while the dump is read once. \n"
+        "--save-path, --custom-regex, --resume, --previous-corpus, --max-article-characters \n"
+        "and --article-time-budget are not used then."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--identifier",
+    default="rules",
+    choices=list(IDENTIFIERS),
+    help=(
+        "How biographies are identified. rules finds the category links and infobox fields of \n"
+        "biography_identifying_rules with substring searches, regex searches biograpy_identifying_regex. \n"
+        "Both give the same result. Not used with --custom-regex."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--merge-to",
+    default=None,
+    help=(
+        "Merges the corpus at --save-path into a corpus at this path in --output-format, \n"
+        "removing duplicate page ids. --max-records 0 (and no --max-bytes) writes a single file, \n"
+        "otherwise the corpus is repartitioned. With --revisions the revision ids and timestamps are kept. \n"
+        "Example usage: \n"
+        "python main.py -s wiki_data/enwiki.json --merge-to wiki_data/enwiki_merged.jsonl --max-records 0"
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--build-index",
+    action="store_true",
+    help=(
+        "Builds the index of the corpus at --save-path for looking up biographies by id, title or name \n"
+        "(see corpus_index.py). Only for uncompressed json and jsonl corpora."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--build-category-index",
+    action="store_true",
+    help=(
+        "Builds the inverted index from every category to the page ids of the corpus at --save-path \n"
+        "(see category_index.py). The statistics then also print the largest categories."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--profile",
+    default=None,
+    help=(
+        "Path of a json report with the time of every stage of the extraction (reading, identifying, \n"
+        "every cleaning step, writing), pages/s, MB/s, the slowest articles and the current and peak memory \n"
+        "of all processes (see profiling.py). Written every --profile-interval seconds and at the end."
+    ),
+)
+
+ARG_PARSER.add_argument(
+    "--profile-interval",
+    default=60,
+    help=(
+        "Seconds between two profile reports during the run. \n"
+    ),
+)
+
 def main():
     args = ARG_PARSER.parse_args()
+    if args.build_index:
+        build_corpus_index(args.save_path)
+        return
+    if args.build_category_index:
+        build_category_index(args.save_path)
+        return
+    if args.merge_to:
+        merge_corpus(args.save_path, args.merge_to,
+                     output_format=args.output_format,
+                     max_records=int(args.max_records),
+                     max_bytes=int(args.max_bytes) if args.max_bytes else None,
+                     compression=args.compression,
+                     revisions=args.revisions)
+        return
     if args.statistics:
-        basic_statistics(args.save_path, args.nr_files, args.language)
+        basic_statistics(args.save_path, args.nr_files, args.language, workers=int(args.workers),
+                         word_count_cache=args.word_count_cache)
+        return
+    if args.configs:
+        configs = load_extraction_configs(args.configs, args.language, int(args.min_characters),
+                                          args.cleaning_engine, args.identifier)
+        process_xml_multi(xml_path=args.wiki_dump_path,
+                          configs=configs,
+                          workers=int(args.workers),
+                          parser=args.parser,
+                          output_format=args.output_format,
+                          max_records=int(args.max_records),
+                          max_bytes=int(args.max_bytes) if args.max_bytes else None,
+                          compression=args.compression,
+                          revisions=args.revisions,
+                          cache_path=args.cache_path,
+                          max_cache_bytes=int(args.max_cache_mb) * 1024 * 1024,
+                          profile_path=args.profile,
+                          profile_interval=float(args.profile_interval))
         return
     if args.custom_regex:
-        biography_regex_pattern = re.compile(args.custom_regex)
+        biography_identifying_pattern = args.custom_regex
+        biography_regex_pattern = re.compile(biography_identifying_pattern)
     else:
         regex_patterns = regex_patterns_by_language[args.language]
         biography_identifying_pattern = regex_patterns["biograpy_identifying_regex"]
-        biography_regex_pattern = re.compile(biography_identifying_pattern)
+        biography_regex_pattern = get_biography_identifier(args.language, args.identifier)
 
     print(biography_identifying_pattern)
     process_xml(xml_path=args.wiki_dump_path,
                 save_path=args.save_path,
                 biography_identifying_regex=biography_regex_pattern,
                 language=args.language,
-                min_characters=int(args.min_characters))
+                min_characters=int(args.min_characters),
+                workers=int(args.workers),
+                parser=args.parser,
+                cleaning_engine=args.cleaning_engine,
+                output_format=args.output_format,
+                max_records=int(args.max_records),
+                max_bytes=int(args.max_bytes) if args.max_bytes else None,
+                compression=args.compression,
+                resume=args.resume,
+                revisions=args.revisions,
+                previous_corpus=args.previous_corpus,
+                cache_path=args.cache_path,
+                max_cache_bytes=int(args.max_cache_mb) * 1024 * 1024,
+                profile_path=args.profile,
+                profile_interval=float(args.profile_interval),
+                max_article_characters=int(args.max_article_characters) if args.max_article_characters else None,
+                article_time_budget=float(args.article_time_budget) if args.article_time_budget else None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+'''This file handles reading wikipedia dumps directly from
+    the compressed pages-articles-multistream.xml.bz2 files.
+
+    A multistream dump is a concatenation of independent bz2
+    streams with (usually) 100 pages each. The companion
+    multistream-index.txt.bz2 has one line per page,
+    "offset:page_id:title", where offset is the byte position
+    of the stream the page is in. With the index every stream
+    can be decompressed on its own, and in parallel.
+'''
+
+import bz2
+import os
+import xml.etree.ElementTree as ET
+import profiling
+
+
+def is_compressed(xml_path):
+    return xml_path.endswith(".bz2")
+
+
+def open_dump(xml_path):
+    '''Opens the dump for streaming, decompressing on the fly
+        if it is a .bz2 file. bz2 handles the concatenated
+        streams of a multistream dump.
+    '''
+    if is_compressed(xml_path):
+        return bz2.open(xml_path, "rb")
+    return open(xml_path, "rb")
+
+
+def find_multistream_index(xml_path):
+    '''Returns the path of the index belonging to a multistream
+        dump if it exists next to it, otherwise None. E.g.
+        enwiki-20230401-pages-articles-multistream.xml.bz2 ->
+        enwiki-20230401-pages-articles-multistream-index.txt.bz2
+        enwiki-20230401-pages-articles-multistream1.xml-p1p41242.bz2 ->
+        enwiki-20230401-pages-articles-multistream-index1.txt-p1p41242.bz2
+    '''
+    directory, file_name = os.path.split(xml_path)
+    if not is_compressed(file_name) or "multistream" not in file_name:
+        return None
+    index_name = file_name.replace("multistream", "multistream-index", 1).replace(".xml", ".txt", 1)
+    index_path = os.path.join(directory, index_name)
+    if os.path.exists(index_path):
+        return index_path
+    return None
+
+
+def read_stream_offsets(index_path):
+    '''Reads the unique stream offsets from the index, in file order.
+    '''
+    offsets = []
+    with bz2.open(index_path, "rb") as index_file:
+        for line in index_file:
+            offset = int(line.split(b":", 1)[0])
+            if not offsets or offsets[-1] != offset:
+                offsets.append(offset)
+    return offsets
+
+
+def iterate_streams(xml_path, index_path):
+    '''Yields (xml_path, start, end) byte ranges of the streams.
+        The first range is the header with the siteinfo and
+        the last one runs to the end of the file so it also
+        includes the closing stream.
+    '''
+    offsets = read_stream_offsets(index_path)
+    file_size = os.path.getsize(xml_path)
+    if not offsets or offsets[0] != 0:
+        offsets.insert(0, 0)
+    offsets.append(file_size)
+    for start, end in zip(offsets, offsets[1:]):
+        yield xml_path, start, end
+
+
+def read_stream(stream):
+    '''Reads and decompresses one (xml_path, start, end) stream.
+    '''
+    xml_path, start, end = stream
+    with open(xml_path, "rb") as dump_file:
+        dump_file.seek(start)
+        compressed = dump_file.read(end - start)
+    return bz2.decompress(compressed)
+
+
+def iterate_fragment_pages(fragment):
+    '''Yields (page_id, title, redirect, text, revision_id, timestamp)
+        for every page in a decompressed stream. A stream is not a
+        valid xml document on its own (no root, and the first/last
+        stream contain the <mediawiki> header/footer) so only the
+        pages are kept and wrapped in a root without namespace.
+    '''
+    first_page = fragment.find(b"<page>")
+    if first_page == -1:
+        return
+    last_page = fragment.rfind(b"</page>") + len(b"</page>")
+    root = ET.fromstring(b"<mediawiki>" + fragment[first_page:last_page] + b"</mediawiki>")
+    for page in root.iter("page"):
+        profiling.count("pages")
+        text = page.find("revision/text")
+        yield (page.findtext("id"), page.findtext("title"),
+               page.find("redirect") is not None,
+               text.text if text is not None else None,
+               page.findtext("revision/id"), page.findtext("revision/timestamp"))
@@ -0,0 +1,270 @@
+'''This file contains the writers for the extracted biographies.
+    A writer gets the biographies one at a time with write and
+    splits them over numbered files, e.g. wiki_0.json, wiki_1.json.
+
+    "json" is the original format, one json list per file of
+    max_records biographies. The whole file is kept in memory
+    until it is saved.
+    "jsonl" writes one biography per line as soon as it is
+    extracted, so the memory use does not depend on the size of
+    the files. A file is finished after max_records records or
+    max_bytes (uncompressed) bytes, whichever comes first, and
+    the files can be compressed with gzip or zstd.
+    "parquet" writes the biographies in columns (id, title, names,
+    categories, text, length, revision_id, timestamp) in row groups of ROW_GROUP_SIZE, so
+    corpus_reader.py can read only the columns it needs.
+
+    The biographies are Biography records (biography.py) or dicts.
+
+    file_count of a writer is the number of finished files. Once a
+    file is finished it is not touched again, which is what the
+    checkpoints of process_xml rely on.
+'''
+
+import gzip
+import json
+from biography import json_default
+from corpus_reader import corpus_prefix
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+COMPRESSION_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+ROW_GROUP_SIZE = 10000
+
+if pa is not None:
+    PARQUET_SCHEMA = pa.schema([
+        ("id", pa.string()),
+        ("title", pa.string()),
+        ("names", pa.list_(pa.string())),
+        ("categories", pa.list_(pa.string())),
+        ("text", pa.string()),
+        ("length", pa.int64()),
+        ("revision_id", pa.string()),
+        ("timestamp", pa.string()),
+    ])
+
+
+def batch_save_path(save_path, file_count, extension=".json"):
+    '''The path of batch number file_count, e.g. wiki_3.json.
+    '''
+    return corpus_prefix(save_path) + "_" + str(file_count) + extension
+
+
+def save_batch(save_path, batch):
+    '''Convert a batch to json and
+        saves a batch of BATCH_SIZE biographies to a json dump.
+    '''
+    print("Saving to json at: " + save_path)
+    with open(save_path, 'w+', encoding="utf-8") as new_json_file:
+        json.dump(batch, new_json_file, indent=1, ensure_ascii=False, default=json_default)
+
+
+def open_compressed(path, compression="none"):
+    '''Opens path for writing text, compressed with compression.
+    '''
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+        return zstandard.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+class JsonBatchWriter:
+    '''Writes the biographies as json lists of max_records
+        biographies per file, like the original process_xml.
+        The last file is always written, even if it is empty.
+
+        file_count is the number of finished files. A resumed run
+        starts at file_count with total_records biographies done.
+    '''
+
+    def __init__(self, save_path, max_records, max_bytes=None, compression="none", file_count=0, total_records=0):
+        if max_bytes is not None or compression != "none":
+            raise ValueError("Rotating by bytes and compression are only supported by the jsonl format")
+        self.save_path = save_path
+        self.max_records = max_records
+        self.batch = []
+        self.file_count = file_count
+        self.total_records = total_records
+
+    def write(self, biography):
+        self.batch.append(biography)
+        self.total_records += 1
+        if len(self.batch) >= self.max_records:
+            print("Biographies found: {}".format(self.total_records))
+            self.save()
+
+    def save(self):
+        save_batch(batch_save_path(self.save_path, self.file_count), self.batch)
+        self.batch = []
+        self.file_count += 1
+
+    def close(self):
+        print("Biographies found: {}".format(self.total_records))
+        self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The unfinished batch is not saved if the extraction failed.
+        if exc_type is None:
+            self.close()
+
+
+class JsonLinesWriter:
+    '''Writes every biography as one line of json as soon as it
+        is written. The file is finished when it has max_records
+        records or max_bytes bytes (before compression), and the
+        next biography starts a new file.
+    '''
+
+    def __init__(self, save_path, max_records, max_bytes=None, compression="none", file_count=0, total_records=0):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression {}, choose one of {}".format(compression, COMPRESSIONS))
+        self.save_path = save_path
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.extension = ".jsonl" + COMPRESSION_EXTENSIONS[compression]
+        self.file_count = file_count
+        self.total_records = total_records
+        self.file_records = 0
+        self.file_bytes = 0
+        self.file = self.open_file()
+
+    def open_file(self):
+        path = batch_save_path(self.save_path, self.file_count, self.extension)
+        print("Saving to jsonl at: " + path)
+        return open_compressed(path, self.compression)
+
+    def write(self, biography):
+        if self.file is None:
+            self.file = self.open_file()
+        line = json.dumps(biography, ensure_ascii=False, default=json_default) + "\n"
+        self.file.write(line)
+        self.file_records += 1
+        self.total_records += 1
+        if self.max_bytes is not None:
+            self.file_bytes += len(line.encode("utf-8"))
+        if self.file_records >= self.max_records or (self.max_bytes is not None and self.file_bytes >= self.max_bytes):
+            self.finish_file()
+
+    def finish_file(self):
+        print("Biographies found: {}".format(self.total_records))
+        self.file.close()
+        self.file = None
+        self.file_count += 1
+        self.file_records = 0
+        self.file_bytes = 0
+
+    def close(self):
+        if self.file is not None:
+            self.finish_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.file is not None:
+            self.file.close()
+
+
+class ParquetWriter:
+    '''Writes the biographies to parquet files of max_records
+        biographies, ROW_GROUP_SIZE rows at a time. length is the
+        number of characters of the text. compression is the
+        parquet codec of the columns (snappy for "none").
+    '''
+
+    def __init__(self, save_path, max_records, max_bytes=None, compression="none", file_count=0, total_records=0):
+        if pq is None:
+            raise ImportError("The parquet format needs the pyarrow package (pip install pyarrow)")
+        if max_bytes is not None:
+            raise ValueError("Rotating by bytes is only supported by the jsonl format")
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression {}, choose one of {}".format(compression, COMPRESSIONS))
+        self.save_path = save_path
+        self.max_records = max_records
+        self.compression = "snappy" if compression == "none" else compression
+        self.rows = []
+        self.file_count = file_count
+        self.total_records = total_records
+        self.file_records = 0
+        self.file = self.open_file()
+
+    def open_file(self):
+        path = batch_save_path(self.save_path, self.file_count, ".parquet")
+        print("Saving to parquet at: " + path)
+        return pq.ParquetWriter(path, PARQUET_SCHEMA, compression=self.compression)
+
+    def write(self, biography):
+        if self.file is None:
+            self.file = self.open_file()
+        self.rows.append(biography)
+        self.file_records += 1
+        self.total_records += 1
+        if len(self.rows) >= ROW_GROUP_SIZE:
+            self.write_row_group()
+        if self.file_records >= self.max_records:
+            self.finish_file()
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        columns = {name: [row[name] for row in self.rows] for name in ("id", "title", "names", "categories", "text")}
+        columns["length"] = [len(text) for text in columns["text"]]
+        # Only saved with revisions, otherwise the columns are null.
+        columns["revision_id"] = [row.get("revision_id") for row in self.rows]
+        columns["timestamp"] = [row.get("timestamp") for row in self.rows]
+        self.file.write_table(pa.Table.from_pydict(columns, schema=PARQUET_SCHEMA))
+        self.rows = []
+
+    def finish_file(self):
+        print("Biographies found: {}".format(self.total_records))
+        self.write_row_group()
+        self.file.close()
+        self.file = None
+        self.file_count += 1
+        self.file_records = 0
+
+    def close(self):
+        if self.file is not None:
+            self.finish_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.file is not None:
+            self.file.close()
+
+
+OUTPUT_FORMATS = {"json": JsonBatchWriter, "jsonl": JsonLinesWriter, "parquet": ParquetWriter}
+
+
+def get_output_writer(output_format, save_path, max_records, max_bytes=None, compression="none",
+                      file_count=0, total_records=0):
+    '''Returns a writer of output_format, one of OUTPUT_FORMATS.
+        file_count and total_records are used when resuming a run.
+    '''
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format {}, choose one of {}".format(output_format, list(OUTPUT_FORMATS)))
+    return OUTPUT_FORMATS[output_format](save_path, max_records, max_bytes, compression, file_count, total_records)
@@ -0,0 +1,199 @@
+'''This file contains a fast alternative to iterating the dump
+    with ElementTree. The pages are found by searching the raw
+    bytes for <page> ... </page> and only the few fields that
+    are needed (id, title, redirect, text and the revision id
+    and timestamp) are sliced out.
+
+    Redirects and pages not matching the identifying regex are
+    rejected before anything but the text is decoded, so for
+    the majority of pages (non-biographies) no python objects
+    besides the decoded text are created.
+
+    This assumes the layout of the mediawiki export format, i.e.
+    that the page <id> comes before <revision> and that the
+    page text is in the one <text> element of the revision.
+'''
+
+import io
+import mmap
+import re
+import profiling
+
+READ_SIZE = 8 * 1024 * 1024
+
+PAGE_START = b"<page>"
+PAGE_END = b"</page>"
+
+XML_ENTITY_PATTERN = re.compile('&(lt|gt|amp|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);')
+XML_ENTITIES = {"lt": "<", "gt": ">", "amp": "&", "quot": '"', "apos": "'"}
+
+
+def scan_pages(buffer, biography_identifying_regex):
+    '''Yields (page_id, title, redirect, text, revision_id, timestamp)
+        for the pages in buffer which are possible biographies.
+    '''
+    for start, end in iterate_page_spans(buffer):
+        page = scan_page(buffer, start, end, biography_identifying_regex)
+        if page is not None:
+            yield page
+
+
+def scan_dump(dump_file, biography_identifying_regex, start=0):
+    '''Same as scan_pages but for an open dump file. A regular
+        file is memory mapped, a compressed file is read in chunks.
+        Reading starts at byte start of the (decompressed) dump.
+    '''
+    for position, page in scan_dump_positions(dump_file, biography_identifying_regex, start):
+        yield page
+
+
+def scan_dump_positions(dump_file, biography_identifying_regex, start=0):
+    '''Same as scan_dump but yields (position, page), where
+        position is the byte position of the <page> in the
+        (decompressed) dump.
+    '''
+    for buffer, page_start, page_end, buffer_position in iterate_file_page_spans(dump_file, start):
+        page = scan_page(buffer, page_start, page_end, biography_identifying_regex)
+        if page is not None:
+            yield buffer_position + page_start, page
+
+
+def iterate_page_spans(buffer, position=0):
+    '''Yields the (start, end) byte positions of every complete
+        <page> ... </page> in buffer.
+    '''
+    while True:
+        start = buffer.find(PAGE_START, position)
+        if start == -1:
+            return
+        end = buffer.find(PAGE_END, start)
+        if end == -1:
+            return
+        position = end + len(PAGE_END)
+        yield start, position
+
+
+def release_mapped(buffer, start, end):
+    '''Tells the kernel that the bytes start to end of the memory
+        mapped buffer are not needed anymore. Returns the position
+        up to which they were released.
+    '''
+    end -= end % mmap.PAGESIZE
+    if hasattr(mmap, "MADV_DONTNEED") and end > start:
+        buffer.madvise(mmap.MADV_DONTNEED, start, end - start)
+    return end
+
+
+def iterate_file_page_spans(dump_file, start=0):
+    '''Yields (buffer, start, end, buffer_position) for every page
+        in dump_file, where buffer_position is the position of
+        buffer in the file. Starts at byte start of the file.
+    '''
+    buffer = None
+    if isinstance(dump_file, io.BufferedReader):
+        try:
+            buffer = mmap.mmap(dump_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # e.g. empty files or pipes can not be mapped.
+            buffer = None
+    if buffer is not None:
+        with buffer:
+            released = 0
+            for page_start, page_end in iterate_page_spans(buffer, start):
+                # The pages before this one were processed, so their
+                # memory is given back instead of growing with the file.
+                if page_start - released >= READ_SIZE:
+                    released = release_mapped(buffer, released, page_start)
+                yield buffer, page_start, page_end, 0
+        return
+
+    if start:
+        # Compressed files seek by decompressing up to start.
+        dump_file.seek(start)
+    buffer_position = start
+    tail = b""
+    while True:
+        chunk = dump_file.read(READ_SIZE)
+        if not chunk:
+            return
+        buffer = tail + chunk if tail else chunk
+        position = 0
+        for page_start, position in iterate_page_spans(buffer):
+            yield buffer, page_start, position, buffer_position
+        # Keep the unfinished page (or a possibly split <page> tag).
+        next_page = buffer.find(PAGE_START, position)
+        if next_page == -1:
+            next_page = max(position, len(buffer) - len(PAGE_START) + 1)
+        tail = buffer[next_page:]
+        buffer_position += next_page
+
+
+def scan_page(buffer, start, end, biography_identifying_regex):
+    '''Extracts (page_id, title, redirect, text, revision_id, timestamp)
+        of the page at buffer[start:end]. Returns None for redirects,
+        pages without text and pages where biography_identifying_regex
+        does not match.
+    '''
+    profiling.count("pages")
+    revision = buffer.find(b"<revision>", start, end)
+    if revision == -1:
+        return None
+    if buffer.find(b"<redirect", start, revision) != -1:
+        return None
+
+    text_tag = buffer.find(b"<text", revision, end)
+    if text_tag == -1:
+        return None
+    text_start = buffer.find(b">", text_tag, end)
+    if buffer[text_start - 1:text_start] == b"/":
+        return None
+    text_end = buffer.find(b"</text>", text_start, end)
+    text = xml_unescape(buffer[text_start + 1:text_end].decode("utf-8"))
+    # Identifying while reading, a step of the read stage.
+    timer = profiling.timer("read.")
+    is_biography = biography_identifying_regex.search(text)
+    timer.lap("identify")
+    if not is_biography:
+        return None
+
+    page_id = extract_element(buffer, b"id", start, revision)
+    title = extract_element(buffer, b"title", start, revision)
+    # The first <id> of the revision is the revision id, the
+    # contributor id comes after the timestamp.
+    revision_id = extract_element(buffer, b"id", revision, text_tag)
+    timestamp = extract_element(buffer, b"timestamp", revision, text_tag)
+    return page_id, title, False, text, revision_id, timestamp
+
+
+def extract_element(buffer, tag, start, end):
+    '''Returns the unescaped text of the first <tag> between start and end.
+    '''
+    open_tag = b"<" + tag + b">"
+    element_start = buffer.find(open_tag, start, end)
+    if element_start == -1:
+        return None
+    element_start += len(open_tag)
+    element_end = buffer.find(b"</" + tag + b">", element_start, end)
+    return xml_unescape(buffer[element_start:element_end].decode("utf-8"))
+
+
+def xml_unescape(text):
+    '''Replaces the xml entities the same way the xml parser does,
+        including the normalization of line endings.
+    '''
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if "&" not in text:
+        return text
+    return XML_ENTITY_PATTERN.sub(replace_entity, text)
+
+
+def replace_entity(match):
+    '''Support function for xml_unescape
+    '''
+    entity = match.group(1)
+    if entity[0] != "#":
+        return XML_ENTITIES[entity]
+    if entity[1] == "x":
+        return chr(int(entity[2:], 16))
+    return chr(int(entity[1:]))
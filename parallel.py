@@ -0,0 +1,194 @@
+'''This file contains the helpers for spreading work over
+    a pool of processes while keeping the output in the
+    same order as the input, and for running the reading and
+    the writing of an extraction in background threads.
+'''
+
+import collections
+import itertools
+import multiprocessing
+import queue
+import threading
+
+# How many chunks each worker may have queued before the
+# reader has to wait. Keeps memory bounded on large dumps.
+PENDING_CHUNKS_PER_WORKER = 4
+# Seconds a blocked thread waits before checking if it should stop.
+QUEUE_POLL_SECONDS = 0.1
+
+
+def ordered_imap(function, items, workers, chunk_size=1, initializer=None, initargs=()):
+    '''Applies function to every item in items using a pool
+        of workers and yields the results in input order.
+        Unlike Pool.imap the input is only consumed as fast
+        as the workers keep up, so a huge iterator (e.g. all
+        pages of a dump) is never buffered in memory.
+        function has to be picklable (module level or a
+        functools.partial of a module level function).
+        initializer(*initargs) is called once in every worker
+        (or in this process if workers <= 1), e.g. to hand large
+        read-only data to the workers without sending it with
+        every chunk.
+    '''
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(function, items)
+        return
+
+    max_pending = workers * PENDING_CHUNKS_PER_WORKER
+    with multiprocessing.Pool(workers, initializer, initargs) as pool:
+        pending = collections.deque()
+        for chunk in chunked(items, chunk_size):
+            pending.append(pool.apply_async(map_chunk, (function, chunk)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+        # Let the workers exit normally (instead of terminating
+        # them) so their exit handlers run.
+        pool.close()
+        pool.join()
+
+
+def map_chunk(function, chunk):
+    '''Runs in the worker. Applies function to a chunk of items.
+    '''
+    return [function(item) for item in chunk]
+
+
+def chunked(items, chunk_size):
+    '''Splits an iterable into lists of at most chunk_size items.
+    '''
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_initializers(initializers):
+    '''Initializer that runs several (initializer, initargs) pairs.
+    '''
+    for initializer, initargs in initializers:
+        initializer(*initargs)
+
+
+def threaded_iterable(items, max_pending):
+    '''Yields the items of items, which are produced by a background
+        thread up to max_pending items ahead, e.g. the pages of a dump
+        so reading and decompressing it overlaps with the cleaning
+        (file reads and bz2 release the GIL). An error in the thread
+        is raised here. If the consumer stops early the thread stops
+        at its next item.
+    '''
+    pending = queue.Queue(max_pending)
+    stop = threading.Event()
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put_unless_stopped(pending, (False, item), stop):
+                    return
+            put_unless_stopped(pending, (True, None), stop)
+        except BaseException as error:
+            put_unless_stopped(pending, (True, error), stop)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            finished, item = pending.get()
+            if finished:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def put_unless_stopped(pending, item, stop):
+    '''Puts item into the queue pending, waiting while it is full
+        until stop is set. Returns False if it was stopped.
+    '''
+    while not stop.is_set():
+        try:
+            pending.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class BackgroundThread:
+    '''Calls function(*args) in a background thread for every
+        put(*args), in order, e.g. writing the biographies so the
+        compression and disk writes overlap with the cleaning. put
+        waits while max_pending calls are queued. An error in the
+        thread is raised by the next put or by close.
+
+        close waits for the queued calls. Leaving the with block with
+        an error drops them instead.
+
+        The thread is only started by the first put, so a pool of
+        processes made before it (e.g. by the generator that gives the
+        items) is not forked from a process with running threads.
+    '''
+
+    def __init__(self, function, max_pending):
+        self.function = function
+        self.pending = queue.Queue(max_pending)
+        self.stop = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.stop.set()
+            if self.thread.is_alive():
+                self.thread.join()
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                args = self.pending.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if args is None:
+                return
+            try:
+                self.function(*args)
+            except BaseException as error:
+                self.error = error
+                self.stop.set()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def put(self, *args):
+        self.raise_error()
+        if self.thread.ident is None:
+            self.thread.start()
+        if not put_unless_stopped(self.pending, args, self.stop):
+            self.raise_error()
+
+    def close(self):
+        if self.thread.ident is None:
+            return
+        put_unless_stopped(self.pending, None, self.stop)
+        self.thread.join()
+        self.raise_error()
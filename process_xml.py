@@ -4,14 +4,44 @@
 '''
 
 import xml.etree.ElementTree as ET
-import json
-from text_processing import process_text
+import collections
+import contextlib
+import functools
+import os
+import time
+from text_processing import process_text, get_cleaning_pipeline
+from parallel import ordered_imap, run_initializers, threaded_iterable, BackgroundThread
+from multistream import open_dump, is_compressed, find_multistream_index, iterate_streams, read_stream, iterate_fragment_pages
+from page_scanner import scan_dump_positions, scan_pages
+from output_writers import get_output_writer
+from biography import Biography
+from corpus_reader import corpus_prefix
+from incremental import PreviousCorpus, set_previous_revisions, is_unchanged, unchanged_marker, save_delta
+from clean_cache import cached_process_text, close_clean_caches, cache_report, evict, MAX_CACHE_BYTES
+from extraction_configs import combined_identifying_regex
+from checkpoint import checkpoint_path, save_checkpoint, load_checkpoint, check_checkpoint_settings, remove_checkpoint
+from profiling import ProfileReport, ArticleTimeout, start_worker_profile, PROFILE_INTERVAL
+from quarantine import quarantine_path, quarantine_marker, QuarantineFile
+import profiling
 import tqdm
 
 BATCH_SIZE = 50000
+# Number of pages sent to a worker at a time when running with workers > 1.
+PAGES_PER_TASK = 64
+# Pages read ahead by the reading thread and biographies waiting
+# for the writing thread. Bound the memory of the pipeline.
+READ_AHEAD_PAGES = 256
+WRITE_BEHIND_BIOGRAPHIES = 1024
 
 
-def process_xml(xml_path, save_path, biography_identifying_regex, language, min_characters=0):
+PARSERS = ("scan", "iterparse")
+
+
+def process_xml(xml_path, save_path, biography_identifying_regex, language, min_characters=0, workers=1,
+                parser="scan", cleaning_engine="pipeline", output_format="json", max_records=BATCH_SIZE,
+                max_bytes=None, compression="none", resume=False, revisions=False, previous_corpus=None,
+                cache_path=None, max_cache_bytes=MAX_CACHE_BYTES, profile_path=None,
+                profile_interval=PROFILE_INTERVAL, max_article_characters=None, article_time_budget=None):
     '''Iterates the xml element tree at xml_path.
         Finds the elements which are id, title, and the
         text body. The biography_identifying_regex determines
@@ -19,59 +49,459 @@ def process_xml(xml_path, save_path, biography_identifying_regex, language, min_
         The text body is processed in process_text where
         the text is stripped from tokens as well
         categories and names are extracted.
-        BATCH_SIZE determines how large each batch, and
-        in extension, each json-file should be.
+        max_records (BATCH_SIZE by default) determines how
+        large each batch, and in extension, each json-file should be.
+
+        With workers > 1 the xml is still read by this process
+        but the identifying regex and process_text run in a
+        pool of worker processes. The biographies come back in
+        page order so the batches are identical to a serial run.
+
+        xml_path can also be a compressed .bz2 dump. If it is a
+        multistream dump with its index next to it, the streams
+        are decompressed and processed by the workers directly.
+
+        parser decides how the pages are read. "scan" (default)
+        uses the byte scanner in page_scanner.py which throws away
+        redirects and non-biographies before building any objects.
+        "iterparse" is the original ElementTree implementation,
+        kept as a reference.
+
+        cleaning_engine chooses the implementation of process_text,
+        see CLEANING_ENGINES in text_processing.py.
+
+        output_format is "json" (a json list per file) or "jsonl"
+        (streamed, one biography per line), see output_writers.py.
+        A new file is started every max_records biographies, and
+        for jsonl also after max_bytes bytes. jsonl files can be
+        compressed with compression "gzip" or "zstd".
+
+        Every time an output file is finished a checkpoint is saved
+        (see checkpoint.py). With resume=True the run continues
+        from the checkpoint of an earlier run with the same
+        settings, if there is one.
+
+        With revisions=True the revision id and timestamp of every
+        biography are saved too. previous_corpus is the save path
+        of a corpus extracted with revisions. Biographies with the
+        same revision in it are copied instead of cleaned again and
+        a delta of the changes is saved, see incremental.py.
+
+        cache_path is a SQLite database where the cleaned texts are
+        cached by the hash of the raw text, see clean_cache.py. After
+        the run the cache is cut down to max_cache_bytes.
+
+        With a profile_path the time of every stage, the throughput
+        and the slowest articles are measured in all processes and
+        saved as a json report every profile_interval seconds and at
+        the end, see profiling.py.
+
+        The dump is read in a background thread and the biographies
+        are written in another one, so reading, decompressing and
+        writing (compression, disk) overlap with the cleaning. Both
+        are connected by bounded queues, READ_AHEAD_PAGES and
+        WRITE_BEHIND_BIOGRAPHIES.
+
+        Biographies with more than max_article_characters characters,
+        or whose cleaning takes more than article_time_budget CPU
+        seconds, are not saved but written to the quarantine file
+        next to the output, see quarantine.py.
+    '''
+    print(biography_identifying_regex)
+    run_start = time.time()
+    previous = None
+    initializers = []
+    report = None
+    if profile_path is not None:
+        report = ProfileReport(profile_path, profile_interval)
+        initializers.append((start_worker_profile, (report.workers_directory, profile_interval)))
+    if previous_corpus is not None:
+        if corpus_prefix(previous_corpus) == corpus_prefix(save_path):
+            raise ValueError("The previous corpus can not be overwritten by the new one, choose another save path")
+        print("Reading the revisions of the previous corpus at: " + previous_corpus)
+        previous = PreviousCorpus(previous_corpus)
+        initializers.append((set_previous_revisions, (previous.revisions,)))
+        revisions = True
+    extract = functools.partial(extract_biography,
+                                biography_identifying_regex=biography_identifying_regex,
+                                language=language,
+                                min_characters=min_characters,
+                                cleaning_engine=cleaning_engine,
+                                revisions=revisions,
+                                incremental=previous is not None,
+                                cache_path=cache_path,
+                                max_article_characters=max_article_characters,
+                                article_time_budget=article_time_budget,
+                                identified=parser == "scan")
+
+    settings = {"xml_path": os.path.abspath(xml_path), "multistream": find_multistream_index(xml_path) is not None,
+                "parser": parser, "language": language, "min_characters": min_characters,
+                "biography_identifying_regex": biography_identifying_regex.pattern,
+                "cleaning_engine": cleaning_engine, "output_format": output_format,
+                "max_records": max_records, "max_bytes": max_bytes, "compression": compression,
+                "revisions": revisions, "max_article_characters": max_article_characters,
+                "article_time_budget": article_time_budget,
+                "previous_corpus": os.path.abspath(previous_corpus) if previous_corpus is not None else None}
+    checkpoint_file = checkpoint_path(save_path)
+    checkpoint = load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint is not None:
+        check_checkpoint_settings(checkpoint, settings)
+        print("Resuming after biography {} ({} biographies in {} files done)".format(
+            checkpoint["last_id"], checkpoint["total_records"], checkpoint["file_count"]))
+        start_position, last_id = checkpoint["position"], checkpoint["last_id"]
+        file_count, total_records = checkpoint["file_count"], checkpoint["total_records"]
+        quarantine_count, quarantine_size = checkpoint.get("quarantine_count", 0), checkpoint.get("quarantine_size", 0)
+    else:
+        start_position, last_id, file_count, total_records = 0, None, 0, 0
+        quarantine_count = quarantine_size = 0
+
+    def write_biography(position, biography):
+        '''Runs in the writing thread.
+        '''
+        if biography.get("quarantined"):
+            # Written in this thread too, so the quarantine file of a
+            # checkpoint has exactly the pages before its position.
+            quarantine.write(biography)
+            return
+        timer = profiling.timer()
+        if biography.get("unchanged"):
+            biography = previous.get(biography["id"], biography["title"])
+            timer.lap("copy_unchanged")
+        finished_files = writer.file_count
+        writer.write(biography)
+        timer.lap("write")
+        if report is not None:
+            report.write_if_due(writer.total_records)
+        if writer.file_count > finished_files:
+            save_checkpoint(checkpoint_file, {"settings": settings, "position": position,
+                                              "last_id": biography["id"],
+                                              "file_count": writer.file_count,
+                                              "total_records": writer.total_records,
+                                              "quarantine_count": quarantine.count,
+                                              "quarantine_size": quarantine.size})
+
+    biographies = iterate_biography_positions(xml_path, extract, biography_identifying_regex, workers, parser,
+                                              start_position, run_initializers, (initializers,))
+    with get_output_writer(output_format, save_path, max_records, max_bytes, compression,
+                           file_count, total_records) as writer, \
+            QuarantineFile(quarantine_path(save_path), quarantine_count, quarantine_size) as quarantine, \
+            BackgroundThread(write_biography, WRITE_BEHIND_BIOGRAPHIES) as writing:
+        for position, biography in biographies:
+            if last_id is not None:
+                # Reading restarts at the last biography of the checkpoint (or
+                # before it), those biographies are already in the finished files.
+                if biography["id"] == last_id:
+                    last_id = None
+                continue
+            writing.put(position, biography)
+        writing.close()
+        if last_id is not None:
+            raise ValueError("Can not resume, biography {} of the checkpoint was not found".format(last_id))
+    remove_checkpoint(checkpoint_file)
+    if quarantine.count:
+        print("Quarantined {} biographies at: {}".format(quarantine.count, quarantine.path))
+    if previous is not None:
+        save_delta(save_path, previous)
+    if cache_path is not None:
+        close_clean_caches()
+        hits, misses = cache_report(cache_path, run_start)
+        print("Cleaning cache: {} hits, {} misses".format(hits, misses))
+        print("Removed {} entries from the cleaning cache".format(evict(cache_path, max_cache_bytes)))
+
+    pipeline = get_cleaning_pipeline(language, cleaning_engine)
+    if workers <= 1 and hasattr(pipeline, "template_stripper"):
+        # The counts of worker processes stay in the workers,
+        # the profile report has the fallbacks of all processes.
+        print(pipeline.template_stripper.report())
+    if report is not None:
+        report.finish(writer.total_records, dump_bytes_read(xml_path, start_position))
+
+
+def process_xml_multi(xml_path, configs, workers=1, parser="scan", output_format="json", max_records=BATCH_SIZE,
+                      max_bytes=None, compression="none", revisions=False, cache_path=None,
+                      max_cache_bytes=MAX_CACHE_BYTES, profile_path=None, profile_interval=PROFILE_INTERVAL):
+    '''Same as process_xml but extracts a corpus for every one of
+        configs (see extraction_configs.py) while reading the dump
+        only once. Every configuration has its own identifying
+        regex, cleaning and save path.
+        Checkpoints, incremental extraction and the quarantine are
+        not supported in this mode.
+    '''
+    run_start = time.time()
+    report = None
+    initializers = []
+    if profile_path is not None:
+        report = ProfileReport(profile_path, profile_interval)
+        initializers.append((start_worker_profile, (report.workers_directory, profile_interval)))
+    extract = functools.partial(extract_configured_biographies, configs=configs, revisions=revisions,
+                                cache_path=cache_path)
+    def write_biographies(page_biographies):
+        '''Runs in the writing thread.
+        '''
+        timer = profiling.timer()
+        for writer, biography in zip(writers, page_biographies):
+            if biography is not None:
+                writer.write(biography)
+        timer.lap("write")
+        if report is not None:
+            report.write_if_due(sum(writer.total_records for writer in writers))
+
+    biographies = iterate_biography_positions(xml_path, extract, combined_identifying_regex(configs), workers, parser,
+                                              0, run_initializers, (initializers,))
+    with contextlib.ExitStack() as stack:
+        writers = [stack.enter_context(get_output_writer(output_format, config["save_path"], max_records,
+                                                         max_bytes, compression))
+                   for config in configs]
+        writing = stack.enter_context(BackgroundThread(write_biographies, WRITE_BEHIND_BIOGRAPHIES))
+        for position, page_biographies in biographies:
+            writing.put(page_biographies)
+        writing.close()
+
+    for config, writer in zip(configs, writers):
+        print("{}: {} biographies saved to {}".format(config["name"], writer.total_records, config["save_path"]))
+    if cache_path is not None:
+        close_clean_caches()
+        hits, misses = cache_report(cache_path, run_start)
+        print("Cleaning cache: {} hits, {} misses".format(hits, misses))
+        print("Removed {} entries from the cleaning cache".format(evict(cache_path, max_cache_bytes)))
+    if report is not None:
+        report.finish(sum(writer.total_records for writer in writers), os.path.getsize(xml_path))
+
+
+def iterate_biography_positions(xml_path, extract, biography_identifying_regex, workers=1, parser="scan",
+                                start_position=0, initializer=None, initargs=()):
+    '''Yields (position, biography) for the biographies of the dump
+        in page order. extract is called on every page and returns a
+        biography or None. Reading the dump from position again
+        (start_position) gives the biography again, or the
+        biographies before it too: position is the byte position of
+        the bz2 stream for a multistream dump, of the page in the
+        (decompressed) dump for the scan parser and always 0 for the
+        iterparse parser.
+        initializer(*initargs) is run in every worker, see ordered_imap.
+    '''
+    if parser not in PARSERS:
+        raise ValueError("Unknown parser {}, choose one of {}".format(parser, PARSERS))
+    index_path = find_multistream_index(xml_path)
+    if index_path is not None:
+        print("Reading streams using the index at: " + index_path)
+        streams = [stream for stream in iterate_streams(xml_path, index_path) if stream[1] >= start_position]
+        extract_stream = functools.partial(extract_stream_biographies, extract=extract,
+                                           biography_identifying_regex=biography_identifying_regex,
+                                           parser=parser)
+        results = ordered_imap(extract_stream, tqdm.tqdm(iterable=streams), workers, 1, initializer, initargs)
+        # results first, so ordered_imap runs to its end and closes the
+        # pool normally (the exit handlers of the workers run).
+        for biographies, stream in zip(results, streams):
+            for biography in biographies:
+                yield stream[1], biography
+    elif parser == "scan":
+        with open_dump(xml_path) as dump_file:
+            positions = collections.deque()
+            pages = tqdm.tqdm(iterable=threaded_iterable(remember_positions(profiling.timed_iterable(
+                scan_dump_positions(dump_file, biography_identifying_regex, start_position), "read"), positions),
+                READ_AHEAD_PAGES))
+            # ordered_imap returns one result per page, in order.
+            for biography in ordered_imap(extract, pages, workers, PAGES_PER_TASK, initializer, initargs):
+                position = positions.popleft()
+                if biography is not None:
+                    yield position, biography
+    else:
+        pages = threaded_iterable(profiling.timed_iterable(iterate_pages(xml_path), "read"), READ_AHEAD_PAGES)
+        for biography in ordered_imap(extract, pages, workers, PAGES_PER_TASK, initializer, initargs):
+            if biography is not None:
+                yield 0, biography
+
+
+def dump_bytes_read(xml_path, start_position):
+    '''The number of bytes of the dump file that are read when
+        reading starts at start_position. A compressed dump without
+        index is decompressed from its start (its positions are in
+        the decompressed dump), so all of it is read.
+    '''
+    dump_bytes = os.path.getsize(xml_path)
+    if is_compressed(xml_path) and find_multistream_index(xml_path) is None:
+        return dump_bytes
+    return dump_bytes - start_position
+
+
+def remember_positions(positioned_items, positions):
+    '''Yields the items of (position, item) pairs and appends
+        the positions to positions.
+    '''
+    for position, item in positioned_items:
+        positions.append(position)
+        yield item
+
+
+def extract_stream_biographies(stream, extract, biography_identifying_regex, parser="scan"):
+    '''Decompresses one stream of a multistream dump and
+        returns the biographies in it.
+    '''
+    timer = profiling.timer()
+    fragment = read_stream(stream)
+    timer.lap("decompress")
+    if parser == "scan":
+        pages = scan_pages(fragment, biography_identifying_regex)
+    else:
+        pages = iterate_fragment_pages(fragment)
+    pages = profiling.timed_iterable(pages, "read")
+    biographies = []
+    for page in pages:
+        biography = extract(page)
+        if biography is not None:
+            biographies.append(biography)
+    return biographies
+
+
+def iterate_pages(xml_path):
+    '''Yields (page_id, title, redirect, text, revision_id, timestamp)
+        for every page in the xml at xml_path.
+    '''
+    with open_dump(xml_path) as dump_file:
+        yield from iterate_dump_pages(tqdm.tqdm(iterable=ET.iterparse(dump_file, events=("start", "end"))))
+
+
+def iterate_dump_pages(events):
+    '''Same as iterate_pages but for the (event, element) pairs of
+        ET.iterparse with events=("start", "end").
 
         strategy to figure out which "id" tag it is
         (we want pages, not revisions):
         based on https://stackoverflow.com/questions/12792998/elementtree-iterparse-strategy
+
+        Every element is cleared when it ends and every page is
+        removed from the root, otherwise the root keeps an empty
+        element for every page of the dump and the memory grows
+        during the whole run.
     '''
-    print(biography_identifying_regex)
     redirect = False
-    total_articles = 0
-    file_count = 0
-    text_batch = []
     path = []
+    root = None
 
-    for event, elem in tqdm.tqdm(iterable=ET.iterparse(xml_path, events=("start", "end"))):
+    for event, elem in events:
         tag = extract_tag(elem)
 
         if event == "start":
+            if root is None:
+                root = elem
             path.append(tag)
         else:
             if tag == "id" and "revision" not in path:
                 page_id = elem.text
+            elif tag == "id" and "contributor" not in path:
+                revision_id = elem.text
+            elif tag == "timestamp":
+                timestamp = elem.text
             elif tag == "redirect":
                 redirect = True
             elif tag == "title":
                 title = elem.text
             elif tag == "text":
-                text = elem.text
-
-                if redirect:
-                    redirect = False
-                elif text is not None and biography_identifying_regex.search(text):
-                    processed_text, names, categories = process_text(
-                        text, language)
-                    if len(processed_text) > min_characters:
-                        text_batch.append({"id": page_id, "title": title, "names": names,
-                                          "categories": categories, "text": str(processed_text)})
-                        total_articles += 1
-
-                if len(text_batch) >= BATCH_SIZE:
-                    print("Biographies found: {}".format(total_articles))
-                    current_save_path = save_path.replace(
-                        ".json", "") + "_" + str(file_count) + ".json"
-                    save_batch(current_save_path, text_batch)
-                    text_batch = []
-                    file_count += 1
+                profiling.count("pages")
+                yield page_id, title, redirect, elem.text, revision_id, timestamp
+                redirect = False
             path.pop()
             elem.clear()
+            if tag == "page":
+                root.clear()
 
-    print("Biographies found: {}".format(total_articles))
-    current_save_path = save_path.replace(
-        ".json", "") + "_" + str(file_count) + ".json"
-    save_batch(current_save_path, text_batch)
+
+def extract_biography(page, biography_identifying_regex, language, min_characters=0, cleaning_engine="pipeline",
+                      revisions=False, incremental=False, cache_path=None, max_article_characters=None,
+                      article_time_budget=None, identified=False):
+    '''Runs the identifying regex and process_text on a page.
+        Returns the biography as a dict or None if the page
+        is a redirect, not a biography or too short.
+        With revisions=True the revision id and timestamp are
+        added. With incremental=True a page with the same revision
+        as in the previous corpus only gives a marker, see
+        incremental.py. With a cache_path the cleaned text is
+        taken from the cache if possible, see clean_cache.py.
+        A biography over max_article_characters or article_time_budget
+        only gives a marker, see quarantine.py.
+        With identified=True the page is known to match the regex
+        (the scan parser only gives such pages) and is not searched
+        again.
+    '''
+    page_id, title, redirect, text, revision_id, timestamp = page
+    if incremental and not redirect and is_unchanged(page_id, revision_id):
+        return unchanged_marker(page_id, title)
+    if redirect or text is None:
+        return None
+    timer = profiling.timer()
+    if not identified:
+        is_biography = biography_identifying_regex.search(text)
+        timer.lap("identify")
+        if not is_biography:
+            timer.finish_article(page_id, len(text))
+            return None
+    if max_article_characters is not None and len(text) > max_article_characters:
+        profiling.count("quarantined")
+        timer.finish_article(page_id, len(text))
+        return quarantine_marker(page_id, title, "size", 0, len(text))
+    try:
+        processed_text, names, categories = clean_text(text, language, cleaning_engine, cache_path,
+                                                       article_time_budget)
+    except ArticleTimeout as timeout:
+        timer.lap("clean")
+        profiling.count("quarantined")
+        timer.finish_article(page_id, len(text))
+        return quarantine_marker(page_id, title, timeout.stage, timeout.seconds, len(text))
+    timer.lap("clean")
+    timer.finish_article(page_id, len(text))
+    if len(processed_text) <= min_characters:
+        return None
+    return make_biography(page, processed_text, names, categories, revisions)
+
+
+def extract_configured_biographies(page, configs, revisions=False, cache_path=None):
+    '''Runs extract_biography for every configuration (see
+        extraction_configs.py) on a page. Returns a list with the
+        biography or None for each configuration, or None if the
+        page is not a biography in any of them. A text is only
+        cleaned once per language and cleaning engine.
+    '''
+    page_id, title, redirect, text, revision_id, timestamp = page
+    if redirect or text is None:
+        return None
+    timer = profiling.timer()
+    biographies = []
+    cleaned_texts = {}
+    for config in configs:
+        is_biography = config["biography_identifying_regex"].search(text)
+        timer.lap("identify")
+        if not is_biography:
+            biographies.append(None)
+            continue
+        key = (config["language"], config["cleaning_engine"])
+        if key not in cleaned_texts:
+            cleaned_texts[key] = clean_text(text, config["language"], config["cleaning_engine"], cache_path)
+            timer.lap("clean")
+        processed_text, names, categories = cleaned_texts[key]
+        if len(processed_text) <= config["min_characters"]:
+            biographies.append(None)
+        else:
+            biographies.append(make_biography(page, processed_text, names, categories, revisions))
+    timer.finish_article(page_id, len(text))
+    if not any(biographies):
+        return None
+    return biographies
+
+
+def clean_text(text, language, cleaning_engine="pipeline", cache_path=None, time_budget=None):
+    '''process_text, through the cache at cache_path if there is one.
+    '''
+    if cache_path is not None:
+        return cached_process_text(text, language, cleaning_engine, cache_path, time_budget)
+    return process_text(text, language, cleaning_engine, time_budget)
+
+
+def make_biography(page, processed_text, names, categories, revisions=False):
+    page_id, title, redirect, text, revision_id, timestamp = page
+    if not revisions:
+        revision_id = timestamp = None
+    return Biography(page_id, title, names, categories, str(processed_text), revision_id, timestamp, revisions)
 
 
 def extract_tag(elem):
@@ -79,12 +509,3 @@ def extract_tag(elem):
         for all tags so we remove them
     '''
     return elem.tag[43:]
-
-
-def save_batch(save_path, batch):
-    '''Convert a batch to json and
-        saves a batch of BATCH_SIZE biographies to a json dump.
-    '''
-    print("Saving to json at: " + save_path)
-    with open(save_path, 'w+', encoding="utf-8") as new_json_file:
-        json.dump(batch, new_json_file, indent=1, ensure_ascii=False)
@@ -0,0 +1,302 @@
+'''This file contains the instrumentation of the extraction
+    (main.py --profile). Every process keeps a StageProfile with
+    the cumulative time and number of calls of the stages (reading
+    the dump, identifying, cleaning and every step of the cleaning,
+    writing), the number of pages it read from the dump, of pages
+    that reached the identification (candidates, the scan parser
+    drops most non-biographies while reading) and of their
+    characters, the slowest articles and its current and peak memory.
+
+    The code that is measured asks for a timer() and calls lap after
+    every stage. When profiling is off timer() returns a timer that
+    does nothing, so the cost is one function call per stage.
+    A timer with a time budget also raises ArticleTimeout at the
+    first lap after the article used more CPU time than the budget.
+
+    Worker processes save their profile to a json file every
+    interval seconds and when they exit, and the main process
+    merges them into the report, which is written every interval
+    seconds during the run and at the end.
+'''
+
+import collections
+import contextlib
+import glob
+import heapq
+import json
+import os
+import shutil
+import time
+from multiprocessing import util
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Seconds between two reports (and saves of the worker profiles).
+PROFILE_INTERVAL = 60
+SLOWEST_ARTICLES = 20
+
+# The StageProfile of this process, None when profiling is off.
+profile = None
+
+
+class StageProfile:
+    '''The measurements of one process. With save_path the profile
+        is saved there every interval seconds (by the timers) and
+        when the process exits.
+    '''
+
+    def __init__(self, save_path=None, interval=PROFILE_INTERVAL):
+        self.pid = os.getpid()
+        self.save_path = save_path
+        self.interval = interval
+        self.saved = time.time()
+        self.seconds = collections.Counter()
+        self.calls = collections.Counter()
+        self.counters = collections.Counter()
+        # Heap of the (seconds, page_id) of the slowest articles.
+        self.slowest = []
+
+    def add(self, stage, seconds):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def add_article(self, page_id, seconds, characters):
+        self.counters["candidates"] += 1
+        self.counters["characters"] += characters
+        if len(self.slowest) < SLOWEST_ARTICLES:
+            heapq.heappush(self.slowest, (seconds, page_id))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, page_id))
+        if self.save_path is not None and time.time() - self.saved >= self.interval:
+            self.save()
+
+    def to_dict(self):
+        return {"seconds": dict(self.seconds), "calls": dict(self.calls), "counters": dict(self.counters),
+                "slowest": list(self.slowest), "rss_mb": rss_mb(),
+                "max_rss_mb": max_rss_mb()}
+
+    def save(self):
+        with open(self.save_path + ".tmp", "w", encoding="utf-8") as profile_file:
+            json.dump(self.to_dict(), profile_file)
+        os.replace(self.save_path + ".tmp", self.save_path)
+        self.saved = time.time()
+
+
+class ArticleTimeout(Exception):
+    '''An article used more than its time budget, stage is the
+        stage that was running when it ran out.
+    '''
+
+    def __init__(self, stage, seconds):
+        super().__init__("Time budget exceeded in {} after {:.1f} s".format(stage, seconds))
+        self.stage = stage
+        self.seconds = seconds
+
+
+class StageTimer:
+    '''Measures consecutive stages, lap(stage) adds the time since
+        the last lap (or since the timer was made) to stage. With a
+        budget (CPU seconds of this thread, so the reading and writing
+        threads do not count) lap raises ArticleTimeout once the
+        article used more. With stage_profile None only the budget is
+        checked.
+    '''
+
+    def __init__(self, stage_profile, prefix="", budget=None):
+        self.profile = stage_profile
+        self.prefix = prefix
+        self.budget = budget
+        self.start = self.last = time.perf_counter()
+        if budget is not None:
+            self.cpu_start = time.thread_time()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        if self.profile is not None:
+            self.profile.add(self.prefix + stage, now - self.last)
+        self.last = now
+        if self.budget is not None:
+            cpu_seconds = time.thread_time() - self.cpu_start
+            if cpu_seconds > self.budget:
+                raise ArticleTimeout(self.prefix + stage, cpu_seconds)
+
+    def finish_article(self, page_id, characters):
+        '''Counts the article with the time since the timer was made.
+        '''
+        self.profile.add_article(page_id, time.perf_counter() - self.start, characters)
+
+
+class NullTimer:
+    def lap(self, stage):
+        pass
+
+    def finish_article(self, page_id, characters):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timer(prefix="", budget=None):
+    '''A StageTimer, or the NullTimer when profiling is off and
+        there is no time budget.
+    '''
+    if profile is None and budget is None:
+        return NULL_TIMER
+    return StageTimer(profile, prefix, budget)
+
+
+def count(counter, number=1):
+    if profile is not None:
+        profile.counters[counter] += number
+
+
+def timed_iterable(items, stage):
+    '''Yields the items of items, adding the time of getting each of
+        them to stage (e.g. reading the pages of the dump).
+    '''
+    if profile is None:
+        yield from items
+        return
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        profile.add(stage, time.perf_counter() - start)
+        yield item
+
+
+@contextlib.contextmanager
+def profiling_on():
+    '''Profiles this process in the with block, e.g. to time the
+        cleaning steps in benchmark.py. Yields the StageProfile.
+    '''
+    global profile
+    previous_profile = profile
+    profile = StageProfile()
+    try:
+        yield profile
+    finally:
+        profile = previous_profile
+
+
+def start_worker_profile(workers_directory, interval=PROFILE_INTERVAL):
+    '''Initializer of the worker processes. A forked worker gets
+        its own profile instead of the one of the main process.
+    '''
+    global profile
+    if profile is not None and profile.pid == os.getpid():
+        return
+    profile = StageProfile(os.path.join(workers_directory, "{}.json".format(os.getpid())), interval)
+    util.Finalize(profile, profile.save, exitpriority=10)
+
+
+def rss_mb():
+    '''The current memory (resident set size) of this process in
+        MB, read from /proc. None where there is no /proc.
+    '''
+    try:
+        with open("/proc/self/statm", "rb") as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def max_rss_mb():
+    '''The peak memory of this process in MB.
+    '''
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ProfileReport:
+    '''Turns profiling on in this process and writes the report
+        of the run to report_path, every interval seconds while
+        write_if_due is called and with final=True at the end.
+    '''
+
+    def __init__(self, report_path, interval=PROFILE_INTERVAL):
+        global profile
+        self.report_path = report_path
+        self.interval = interval
+        self.workers_directory = report_path + ".workers"
+        shutil.rmtree(self.workers_directory, ignore_errors=True)
+        os.makedirs(self.workers_directory)
+        self.start = self.written = time.time()
+        profile = StageProfile()
+
+    def write_if_due(self, biographies):
+        if time.time() - self.written >= self.interval:
+            self.write(biographies)
+
+    def write(self, biographies, dump_bytes=None, final=False):
+        '''Merges the profiles of this process and the workers and
+            writes the report. dump_bytes is the number of bytes read
+            from the dump (file).
+        '''
+        elapsed = time.time() - self.start
+        profiles = [profile.to_dict()]
+        for path in sorted(glob.glob(os.path.join(self.workers_directory, "*.json"))):
+            with open(path, encoding="utf-8") as profile_file:
+                profiles.append(json.load(profile_file))
+        seconds = collections.Counter()
+        calls = collections.Counter()
+        counters = collections.Counter()
+        for process_profile in profiles:
+            seconds.update(process_profile["seconds"])
+            calls.update(process_profile["calls"])
+            counters.update(process_profile["counters"])
+        slowest = heapq.nlargest(SLOWEST_ARTICLES, (tuple(article) for process_profile in profiles
+                                                    for article in process_profile["slowest"]))
+        report = {
+            "final": final,
+            "elapsed_seconds": elapsed,
+            "biographies": biographies,
+            "pages": counters["pages"],
+            "pages_per_second": counters["pages"] / elapsed,
+            "candidates": counters["candidates"],
+            "biographies_per_second": biographies / elapsed,
+            "text_megabytes_per_second": counters["characters"] / elapsed / 1e6,
+            "dump_megabytes_per_second": dump_bytes / elapsed / 1e6 if dump_bytes is not None else None,
+            # Steps of a stage are named "stage.step", e.g. "clean.strip_refs".
+            "stages": {stage: {"seconds": seconds[stage], "calls": calls[stage]}
+                       for stage in sorted(seconds, key=seconds.get, reverse=True)},
+            "counters": dict(counters),
+            "slowest_articles": [{"id": page_id, "seconds": article_seconds}
+                                 for article_seconds, page_id in slowest],
+            # The memory of the workers is from when they last saved their profile.
+            "rss_mb": {"main": profiles[0]["rss_mb"],
+                       "workers": [process_profile.get("rss_mb") for process_profile in profiles[1:]]},
+            "max_rss_mb": {"main": profiles[0]["max_rss_mb"],
+                           "workers": [process_profile["max_rss_mb"] for process_profile in profiles[1:]]},
+        }
+        with open(self.report_path + ".tmp", "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=1)
+        os.replace(self.report_path + ".tmp", self.report_path)
+        self.written = time.time()
+        return report
+
+    def finish(self, biographies, dump_bytes=None):
+        '''Writes the final report, prints a summary and turns
+            profiling off.
+        '''
+        global profile
+        report = self.write(biographies, dump_bytes, final=True)
+        shutil.rmtree(self.workers_directory, ignore_errors=True)
+        profile = None
+        print("Profile saved at: {} ({:.1f} pages/s, {:.2f} text MB/s)".format(
+            self.report_path, report["pages_per_second"], report["text_megabytes_per_second"]))
+        if report["rss_mb"]["main"] is not None:
+            print("    memory: {:.0f} MB, peak {:.0f} MB".format(report["rss_mb"]["main"], report["max_rss_mb"]["main"]))
+        for stage, stage_report in report["stages"].items():
+            if "." not in stage:
+                print("    {}: {:.2f} s in {} calls".format(stage, stage_report["seconds"], stage_report["calls"]))
+        return report
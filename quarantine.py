@@ -0,0 +1,73 @@
+'''This file contains the quarantine of an extraction run, the
+    biographies that were not cleaned because they are too large
+    (max_article_characters) or their cleaning ran out of its time
+    budget (article_time_budget). One pathological page, e.g. a huge
+    list with thousands of tables or external links, can otherwise
+    keep a worker busy for minutes.
+
+    The quarantined pages are saved next to the output, e.g.
+    wiki_data/enwiki.quarantine.jsonl, one json line per page with
+    its id, title, number of characters, the stage where it was
+    stopped ("size" or the cleaning step, e.g. "clean.strip_tables")
+    and the CPU seconds it had used.
+'''
+
+import json
+import os
+from corpus_reader import corpus_prefix
+
+
+def quarantine_path(save_path):
+    '''wiki_data/enwiki.json -> wiki_data/enwiki.quarantine.jsonl
+    '''
+    return corpus_prefix(save_path) + ".quarantine.jsonl"
+
+
+def quarantine_marker(page_id, title, stage, seconds, characters):
+    '''What extract_biography returns instead of the biography.
+    '''
+    return {"id": page_id, "title": title, "quarantined": True, "stage": stage,
+            "seconds": round(seconds, 3), "characters": characters}
+
+
+class QuarantineFile:
+    '''Appends the quarantined pages of a run to the file at path.
+        The file is only created when the first page is quarantined,
+        an existing file is replaced. A resumed run passes the count
+        and size of the file at its checkpoint, the pages written
+        after the checkpoint are then removed, as they are read and
+        quarantined again.
+    '''
+
+    def __init__(self, path, count=0, size=0):
+        self.path = path
+        if size and os.path.exists(path):
+            with open(path, "r+b") as quarantine_file:
+                quarantine_file.truncate(size)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            count = size = 0
+        self.file = None
+        self.count = count
+        self.size = size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, marker):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        record = {key: value for key, value in marker.items() if key != "quarantined"}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.count += 1
+        self.size = self.file.tell()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
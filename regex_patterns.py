@@ -80,25 +80,61 @@ ru_identifying_regex = '\| *[Дд]ата рождения|\| *[Дд]ата см
 fa_identifying_regex = '\[\[رده:(افراد زنده.*|زادگان.*|درگذشتگان.*)\]\]'
 zh_identifying_regex = '(\[\[(Category|分类|分類):(在世人物|.*逝世|.*出生))|(\{\{bd\|.*\}\})'
 
+# The same decisions as the identifying regexes above, for the
+# BiographyClassifier in biography_classifier.py.
+en_identifying_rules = {
+    "links": [("[[Category:", "Living people", None),
+              ("[[Category:", "", "deaths"),
+              ("[[Category:", "", "births")],
+}
+sv_identifying_rules = {
+    "links": [("[[Kategori:", "Levande personer", None),
+              ("[[Kategori:", "Födda", None),
+              ("[[Kategori:", "Avlidna", None)],
+}
+ru_identifying_rules = {
+    "links": [("[[Категория:", "Персоналии по алфавиту", None),
+              ("[[Категория:", "Родившиеся", None),
+              ("[[Категория:", "Умершие", None)],
+    "fields": ["Дата рождения", "дата рождения", "Дата смерти", "дата смерти",
+               "Место рождения", "место рождения", "Место смерти", "место смерти"],
+}
+fa_identifying_rules = {
+    "links": [("[[رده:", "افراد زنده", "]]"),
+              ("[[رده:", "زادگان", "]]"),
+              ("[[رده:", "درگذشتگان", "]]")],
+}
+zh_identifying_rules = {
+    "links": [(prefix, start, line_contains)
+              for prefix in ("[[Category:", "[[分类:", "[[分類:")
+              for start, line_contains in (("在世人物", None), ("", "逝世"), ("", "出生"))]
+             + [("{{bd|", "", "}}")],
+}
+
 regex_patterns_by_language = { 
     'english' : {
         "biograpy_identifying_regex" : en_identifying_regex,
+        "biography_identifying_rules" : en_identifying_rules,
         "cleaning_vocab" : en_vocab_regex,
     },
     'swedish' : {
         "biograpy_identifying_regex" : sv_identifying_regex,
+        "biography_identifying_rules" : sv_identifying_rules,
         "cleaning_vocab" : sv_vocab_regex,
     },
     'russian' : {
         "biograpy_identifying_regex" : ru_identifying_regex,
+        "biography_identifying_rules" : ru_identifying_rules,
         "cleaning_vocab" : ru_vocab_regex,
     },
     'persian' : {
         "biograpy_identifying_regex" : fa_identifying_regex,
+        "biography_identifying_rules" : fa_identifying_rules,
         "cleaning_vocab" : fa_vocab_regex,
     },
     'chinese' : {
         "biograpy_identifying_regex" : zh_identifying_regex,
+        "biography_identifying_rules" : zh_identifying_rules,
         "cleaning_vocab" : zh_vocab_regex,
     },
 }
\ No newline at end of file
@@ -0,0 +1,490 @@
+'''This file contains a fast replacement for removing the top
+    level templates with mwparserfromhell.
+
+    process_text parses every biography with mwparserfromhell just
+    to list the templates that are not nested in anything else, and
+    then removes them with one str.replace per template. Here the
+    top level {{...}} are found by matching braces in one scan over
+    the text, skipping the constructs mwparserfromhell would put
+    the templates in (comments, tags, wikilinks, external links,
+    headings, tables and bold/italic text).
+
+    Input that can not be handled this way with confidence (argument
+    braces {{{, unbalanced braces, tables, bold/italic or <nowiki>,
+    <pre> and <math> that are not closed, links with markup in their
+    title, ...) falls back to mwparserfromhell. The
+    TemplateStripper counts how often that happens.
+'''
+
+import bisect
+import functools
+import re
+import mwparserfromhell as mwp
+import profiling
+
+TOP_LEVEL_TOKEN_PATTERN = re.compile(r'\{\{|<!--|\[\[|<[a-zA-Z]|\[(?:https?:)?//')
+TEMPLATE_TOKEN_PATTERN = re.compile(r'\{\{|\}\}|<!--|<(?:nowiki|pre|math)\b|[{}]', re.IGNORECASE)
+BRACES_PATTERN = re.compile(r'\{\{')
+LINK_TOKEN_PATTERN = re.compile(r'\[\[|\]\]')
+TABLE_LINE_PATTERN = re.compile(r'^[ \t]*(\{\||\|\}(?!\}))', re.MULTILINE)
+QUOTES_PATTERN = re.compile("''+")
+QUOTES_OR_NEWLINE_PATTERN = re.compile("''+|\n")
+TAG_NAME_PATTERN = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)')
+ANY_TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)\b[^>]*?(/?)>')
+PARSER_TAG_PATTERN = re.compile(r'<(/?)(nowiki|pre|math)\b[^>]*?(/?)>', re.IGNORECASE)
+MARKUP_CHARACTERS_PATTERN = re.compile(r'[\[\]{}<>]')
+EXTERNAL_LINK_START_PATTERN = re.compile(r'\[(?:https?:)?//')
+# What ends the url or label of an external link, see find_top_level_templates.
+EXTERNAL_LINK_END_PATTERN = re.compile(r'\]|\{\{|\[|<[a-zA-Z/!]')
+
+# Tags that never wrap any content, see mwparserfromhell.definitions.SINGLE
+SINGLE_TAGS = {'br', 'wbr', 'hr', 'meta', 'link', 'img', 'li', 'dt', 'dd', 'th', 'td', 'tr'}
+
+
+class TemplateStripper:
+    '''Removes the top level templates of a text. Keeps count of
+        how many texts it stripped and how many of them had to
+        fall back to mwparserfromhell.
+    '''
+
+    def __init__(self):
+        self.texts = 0
+        self.fallbacks = 0
+
+    def strip(self, text):
+        self.texts += 1
+        spans = find_top_level_templates(text)
+        if spans is None:
+            self.fallbacks += 1
+            # Also counted over all processes with main.py --profile.
+            profiling.count("template_fallbacks")
+            return strip_templates_mwp(text)
+        if has_other_occurrences(text, spans):
+            # str.replace also removes the copies nested in other
+            # constructs, in template order. Do exactly the same.
+            for template in [text[start:end] for start, end in spans]:
+                text = text.replace(template, '')
+            return text
+        return remove_spans(text, spans)
+
+    def report(self):
+        return "Template stripping fell back to mwparserfromhell for {} of {} texts".format(
+            self.fallbacks, self.texts)
+
+
+def strip_templates_mwp(text):
+    '''The original way of removing the top level templates.
+    '''
+    wikicode = mwp.parse(text)
+    templates = wikicode.filter_templates(recursive=False)
+    for t in templates:
+        text = text.replace(str(t), '')
+    return text
+
+
+def remove_spans(text, spans):
+    '''Removes the (start, end) spans from text, spans have to be sorted.
+    '''
+    if not spans:
+        return text
+    pieces = []
+    position = 0
+    for start, end in spans:
+        pieces.append(text[position:start])
+        position = end
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+
+def has_other_occurrences(text, spans):
+    '''Checks if any of the top level templates also occurs
+        somewhere else than at its own span, e.g. a {{lang|..}}
+        that is both top level and inside a table.
+    '''
+    starts = set()
+    templates_by_head = {}
+    for start, end in spans:
+        starts.add(start)
+        templates_by_head.setdefault(text[start:start + 5], set()).add(text[start:end])
+    for braces in BRACES_PATTERN.finditer(text):
+        position = braces.start()
+        if position in starts:
+            continue
+        for template in templates_by_head.get(text[position:position + 5], ()):
+            if text.startswith(template, position):
+                return True
+    return False
+
+
+def find_top_level_templates(text):
+    '''Returns the (start, end) of every top level template in
+        text, or None if the text has to be handled by
+        mwparserfromhell.
+    '''
+    if '{{' not in text:
+        return []
+    if '{{{' in text:
+        return None
+    parser_tags = find_parser_tags(text)
+    if parser_tags is None:
+        return None
+    tables = find_tables(text, parser_tags)
+    if tables is None or not quotes_balanced(text):
+        return None
+
+    spans = []
+    line_quotes = LineQuotes(text)
+    position = 0
+    while True:
+        token = TOP_LEVEL_TOKEN_PATTERN.search(text, position)
+        if token is None:
+            return spans
+        start = token.start()
+        marker = token.group()
+        if marker == '{{':
+            end = match_template(text, start)
+            if end is None:
+                return None
+            top_level = is_top_level(text, start, end, tables, line_quotes)
+            if top_level is None:
+                return None
+            if top_level:
+                spans.append((start, end))
+            position = end
+        elif marker == '<!--':
+            end = text.find('-->', token.end())
+            if text.find("''", start, end) != -1:
+                # The quotes are counted as if there were no comments.
+                return None
+            position = end + 3 if end != -1 else token.end()
+        elif marker == '[[':
+            end = match_link(text, start)
+            if end is not None and (MARKUP_CHARACTERS_PATTERN.search(text, start + 2, link_title_end(text, start, end))
+                                    or not quotes_closed(text, start, end)
+                                    or not contents_closed(text, start + 2, end - 2)):
+                # mwparserfromhell does not read it as a link.
+                return None
+            position = end or token.end()
+        elif marker[0] == '<':
+            end = match_tag(text, start)
+            if end is not None and not (quotes_closed(text, start, end) and
+                                        contents_closed(text, text.find('>', start, end) + 1,
+                                                        text.rfind('<', start, end))):
+                return None
+            position = end or token.end()
+        else:
+            # Templates, links and tags in an external link are parsed
+            # differently by mwparserfromhell, also when it is not closed.
+            end = EXTERNAL_LINK_END_PATTERN.search(text, token.end(), find_line_end(text, start))
+            if end is not None and end.group() != ']':
+                return None
+            position = end.end() if end is not None else token.end()
+        if marker != '{{' and crosses_parser_tag(parser_tags, position):
+            # A comment, tag or link that ends in a <nowiki>, <pre> or <math>.
+            return None
+        if marker != '{{' and text.find('\n', start, position) != -1:
+            # Tags, comments and links over multiple lines that start on a heading line.
+            line_quotes.count_until(start)
+            if text.startswith('=', line_quotes.line_start):
+                return None
+
+
+def match_template(text, start):
+    '''Returns the end of the template starting at start, or
+        None if the braces are not balanced (also single braces,
+        which make the match ambiguous, e.g. with a table end |})
+        or the template has no name.
+    '''
+    depth = 0
+    position = start
+    while True:
+        token = TEMPLATE_TOKEN_PATTERN.search(text, position)
+        if token is None:
+            return None
+        marker = token.group()
+        if marker == '{{':
+            depth += 1
+            position = token.end()
+        elif marker == '}}':
+            depth -= 1
+            position = token.end()
+            if depth == 0:
+                break
+        elif marker in ('{', '}'):
+            return None
+        elif marker == '<!--':
+            end = text.find('-->', token.end())
+            if end == -1:
+                return None
+            position = end + 3
+        else:
+            position = match_tag(text, token.start()) or token.end()
+
+    name = re.split(r'\||\}\}', text[start + 2:position], maxsplit=1)[0]
+    if not name.strip() or MARKUP_CHARACTERS_PATTERN.search(name):
+        return None
+    # Bold/italic opened in a parameter but closed after the
+    # template breaks the template in mwparserfromhell.
+    if not quotes_closed(text, start, position) or not contents_closed(text, start + 2, position - 2):
+        return None
+    return position
+
+
+def quotes_closed(text, start, end):
+    '''Checks that the bold and italics opened between start and
+        end are also closed there (and are no runs of 4 or more
+        quotes).
+    '''
+    if text.find("''", start, end) == -1:
+        return True
+    quotes = [len(quotes.group()) for quotes in QUOTES_PATTERN.finditer(text, start, end)]
+    return quotes.count(2) % 2 == 0 and quotes.count(3) % 2 == 0 and all(length in (2, 3) for length in quotes)
+
+
+def match_link(text, start):
+    '''Returns the end of the wikilink starting at start,
+        or None if it is not a valid (closed) wikilink.
+    '''
+    depth = 0
+    for token in LINK_TOKEN_PATTERN.finditer(text, start):
+        if token.group() == '[[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                title_end = text.find('|', start, token.start())
+                if title_end == -1:
+                    title_end = token.start()
+                if '\n' in text[start:title_end]:
+                    return None
+                return token.end()
+    return None
+
+
+def link_title_end(text, start, end):
+    '''The end of the title of the wikilink at start:end.
+    '''
+    title_end = text.find('|', start, end - 2)
+    return end - 2 if title_end == -1 else title_end
+
+
+@functools.lru_cache(maxsize=None)
+def tag_pattern(name):
+    return re.compile(r'<(/?)' + re.escape(name) + r'\b[^>]*?(/?)>', re.IGNORECASE)
+
+
+def match_tag(text, start):
+    '''Returns the end of the tag (including its contents and
+        closing tag) starting at start, or None if it is not
+        closed and therefore just text.
+    '''
+    name = TAG_NAME_PATTERN.match(text, start).group(1).lower()
+    pattern = tag_pattern(name)
+    opening = pattern.match(text, start)
+    if opening is None or opening.group(1):
+        return None
+    if opening.group(2) or name in SINGLE_TAGS:
+        return opening.end()
+    depth = 1
+    comments = text.find('<!--', opening.end()) != -1
+    for token in pattern.finditer(text, opening.end()):
+        if comments and in_comment(text, opening.end(), token.start()):
+            continue
+        closing, self_closing = token.groups()
+        if closing:
+            depth -= 1
+            if depth == 0:
+                return token.end()
+        elif not self_closing:
+            depth += 1
+    return None
+
+
+def contents_closed(text, start, end):
+    '''Checks that the contents text[start:end] of a template, link or
+        tag close everything they open: no closing tag without its
+        opening tag, no comment that goes on after the end (or that
+        has tags in it), as many {{ as }} and no external link
+        without its ]. Otherwise the construct (or what is in it)
+        is parsed differently by mwparserfromhell.
+    '''
+    comment = text.find('<!--', start, end)
+    while comment != -1:
+        comment_end = text.find('-->', comment + 4, end)
+        if comment_end == -1 or text.find('<', comment + 4, comment_end) != -1:
+            return False
+        comment = text.find('<!--', comment_end + 3, end)
+    if text.count('{{', start, end) != text.count('}}', start, end):
+        return False
+    if text.find('//', start, end) != -1:
+        for link in EXTERNAL_LINK_START_PATTERN.finditer(text, start, end):
+            link_end = EXTERNAL_LINK_END_PATTERN.search(text, link.end(), min(end, find_line_end(text, link.start())))
+            if link_end is None or link_end.group() != ']':
+                return False
+    if text.find('</', start, end) == -1:
+        return True
+    depths = {}
+    for tag in ANY_TAG_PATTERN.finditer(text, start, end):
+        closing, name, self_closing = tag.groups()
+        name = name.lower()
+        if closing:
+            depths[name] = depths.get(name, 0) - 1
+            if depths[name] < 0:
+                return False
+        elif not self_closing and name not in SINGLE_TAGS:
+            depths[name] = depths.get(name, 0) + 1
+    return True
+
+
+def find_parser_tags(text):
+    '''Returns the (start, end) of every <nowiki>, <pre> and <math>
+        (their contents are not parsed), or None if one is not closed,
+        is nested in another one or a closing tag has no opening one.
+        mwparserfromhell reads those as text, but what they contain
+        still changes how the rest is parsed.
+    '''
+    spans = []
+    opening = None
+    for tag in PARSER_TAG_PATTERN.finditer(text):
+        closing, name, self_closing = tag.groups()
+        if opening is not None:
+            if not closing or name.lower() != opening.group(2).lower():
+                return None
+            spans.append((opening.start(), tag.end()))
+            opening = None
+        elif closing:
+            return None
+        elif self_closing:
+            spans.append((tag.start(), tag.end()))
+        else:
+            opening = tag
+    if opening is not None:
+        return None
+    return spans
+
+
+def crosses_parser_tag(parser_tags, position):
+    '''Checks if position is inside one of the parser_tags (the
+        spans of find_parser_tags).
+    '''
+    tag = bisect.bisect_left(parser_tags, (position,)) - 1
+    return tag >= 0 and position < parser_tags[tag][1]
+
+
+def in_comment(text, start, position):
+    '''Checks if position is in a (closed) comment that starts
+        after start.
+    '''
+    comment = text.rfind('<!--', start, position)
+    return (comment != -1 and text.find('-->', comment + 4, position) == -1
+            and text.find('-->', position) != -1)
+
+
+def find_tables(text, parser_tags):
+    '''Returns the (start, end) of the outermost wikitables, or
+        None if the tables are not balanced. Table lines in one of
+        the parser_tags (see find_parser_tags) are text.
+    '''
+    if '{|' not in text:
+        return []
+    tables = []
+    depth = 0
+    for line in TABLE_LINE_PATTERN.finditer(text):
+        if crosses_parser_tag(parser_tags, line.start(1)):
+            continue
+        if line.group(1) == '{|':
+            if depth == 0:
+                table_start = line.start(1)
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                tables.append((table_start, line.end()))
+    if depth != 0:
+        return None
+    return tables
+
+
+def quotes_balanced(text):
+    '''Checks that the bold and italics are closed on every line.
+        mwparserfromhell has its own rules for recovering from
+        unbalanced ones (and for runs of 4 or more than 5 quotes)
+        which are not reproduced here.
+    '''
+    if "''" not in text:
+        return True
+    italics = bolds = 0
+    for token in QUOTES_OR_NEWLINE_PATTERN.finditer(text):
+        length = token.end() - token.start()
+        if length == 1:
+            if italics % 2 or bolds % 2:
+                return False
+        elif length in (2, 5):
+            italics += 1
+        if length in (3, 5):
+            bolds += 1
+        elif length not in (1, 2):
+            return False
+    return italics % 2 == 0 and bolds % 2 == 0
+
+
+def find_line_end(text, position):
+    line_end = text.find('\n', position)
+    return len(text) if line_end == -1 else line_end
+
+
+class LineQuotes:
+    '''Keeps track of the line the scan is on and of the bold and
+        italic markers on it. Every count continues from where
+        the last one stopped, so long lines with many templates
+        are only scanned once.
+    '''
+
+    def __init__(self, text):
+        self.text = text
+        self.line_start = 0
+        self.position = 0
+        self.italics = 0
+        self.bolds = 0
+
+    def count_until(self, position):
+        '''Moves to position. Returns the number of italic and bold
+            markers between the start of its line and position.
+        '''
+        newline = self.text.rfind('\n', self.position, position)
+        if newline != -1:
+            self.line_start = self.position = newline + 1
+            self.italics = self.bolds = 0
+        for quotes in QUOTES_PATTERN.finditer(self.text, self.position, position):
+            length = quotes.end() - quotes.start()
+            if length != 3:
+                self.italics += 1
+            if length != 2:
+                self.bolds += 1
+        self.position = position
+        return self.italics, self.bolds
+
+
+def is_top_level(text, start, end, tables, line_quotes):
+    '''Checks that the template at start:end is not in a table,
+        a heading or bold/italic text. Returns None if that is
+        ambiguous. Expects quotes_balanced(text).
+    '''
+    table = bisect.bisect_right(tables, (start, len(text))) - 1
+    if table >= 0 and start < tables[table][1]:
+        return False
+
+    italics, bolds = line_quotes.count_until(start)
+    multiline = text.find('\n', start, end) != -1
+    if text.startswith('=', line_quotes.line_start):
+        # Only a heading that is the whole line is handled here.
+        if multiline or not text[line_quotes.line_start:find_line_end(text, end)].rstrip().endswith('='):
+            return None
+        return False
+
+    if italics % 2 == 0 and bolds % 2 == 0:
+        return True
+    if multiline:
+        return None
+    # The line is balanced, so the bold/italic is closed after the template.
+    return False
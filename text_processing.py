@@ -10,7 +10,10 @@ import mwparserfromhell as mwp
 import pandas as pd
 import json
 import re
+import functools
 from regex_patterns import regex_patterns_by_language
+from template_stripper import TemplateStripper
+import profiling
 
 def extract_names(text):
     '''Extract any NAMES (bold, in first paragraph) and return them.
@@ -159,11 +162,331 @@ def strip_misc(text):
     text = re.sub(ugly_links, "", text)
     return text
 
-def process_text(text, language):
+def process_text(text, language, engine="pipeline", time_budget=None):
     '''The main function of the text processing.
         Runs a series of extraction and cleaning functions
         on the text. Extracts categories and names.
-        
+
+        The cleaning is done by the CleaningPipeline of the
+        language, which is built once and gives the same
+        output as process_text_reference. With
+        engine="single_pass" the SinglePassPipeline is used.
+
+        With a time_budget (CPU seconds) profiling.ArticleTimeout is
+        raised after the first cleaning step that ends over budget.
+        A running regex can not be interrupted, so one step can
+        still take longer than the budget.
+    '''
+    return get_cleaning_pipeline(language, engine).clean(text, time_budget)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cleaning_pipeline(language, engine="pipeline"):
+    '''Returns the cleaning pipeline of a language. Built the first
+        time it is asked for (once per process).
+        engine is one of CLEANING_ENGINES.
+    '''
+    if engine not in CLEANING_ENGINES:
+        raise ValueError("Unknown cleaning engine {}, choose one of {}".format(engine, list(CLEANING_ENGINES)))
+    return CLEANING_ENGINES[engine](regex_patterns_by_language[language]["cleaning_vocab"])
+
+
+class CleaningPipeline:
+    '''The same steps as process_text_reference but with every regex
+        pattern built and compiled once from the cleaning_vocab of a
+        language, instead of concatenating the pattern strings and
+        looking them up in the re cache for every article.
+        The imagemaps, wikitables, galleries and [http...] links are
+        found with str.find, their patterns backtrack for minutes on
+        pages with many unclosed tables or links.
+
+        ***WARNING***
+        The steps in clean have to stay in the same order as in
+        process_text_reference.
+    '''
+
+    def __init__(self, cleaning_vocab):
+        rd = cleaning_vocab
+        self.category_pattern = re.compile('\[\['+rd["category"]+':.+?\]\]')
+        self.category_prefix_pattern = re.compile('\[\['+rd["category"] + ':')
+        self.category_end_pattern = re.compile('\]\]')
+        self.category_pipe_pattern = re.compile('\|.*')
+        self.alias_pattern = re.compile("'''(.*?)'''")
+        self.ref_pattern = re.compile('<ref[\s\S]+?/(ref)?>')
+        self.edit_pattern = re.compile('<\!--.+?-->')
+        self.table_end_pattern = re.compile('\\\\n\\\\n\s')
+        self.etc_pattern = re.compile('==+[ ]{0,1}('+ rd['references']+'|'+rd['external links']+'|'+rd['further reading']+'|'+rd['see also']+'|'+rd['notes']+')[ ]{0,1}==+[\s\S]+')
+        self.heading_pattern = re.compile('==+.+?==+')
+        self.regular_link_pattern = re.compile('\[\[(?!'+rd['image']+'|'+rd['file']+')([^\|]+?)\]\]')
+        self.piped_link_pattern = re.compile('\[\[(?!'+rd['image']+'|'+rd['file']+')([^\]]+?)\|(.+?)\]\]')
+        self.file_pattern = re.compile('\[\[('+rd['image']+'|'+rd['file']+'):.+?\]\]')
+        self.nl_pattern = re.compile('\\\\n')
+        self.format_pattern = re.compile('<.+?>')
+        self.misc_table_pattern = re.compile('\{\|.+?\|\}')
+        self.empty_paren_pattern = re.compile('\(\)')
+        self.bullet_pattern = re.compile('\*')
+
+    def clean(self, text, time_budget=None):
+        '''Cleans the text of one article.
+            Returns (text, names, categories) like process_text.
+        '''
+        # The steps are timed with main.py --profile, named
+        # like the functions of process_text_reference.
+        timer = profiling.timer("clean.", time_budget)
+        text = self.strip_templates(text)
+        timer.lap("strip_templates")
+        categories = self.extract_categories(text)
+        timer.lap("extract_categories")
+        text = self.ref_pattern.sub(" ", text)
+        timer.lap("strip_refs")
+        text = self.edit_pattern.sub(" ", text)
+        timer.lap("strip_editornotes")
+        text = self.strip_imagemap(text)
+        timer.lap("strip_imagemap")
+        text = self.strip_tables(text)
+        timer.lap("strip_tables")
+        text = self.strip_galleries(text)
+        timer.lap("strip_galleries")
+        text = self.etc_pattern.sub(" ", text)
+        timer.lap("remove_etc_sections")
+        text = self.category_pattern.sub("", text)
+        timer.lap("strip_categories")
+        names = self.extract_names(text)
+        timer.lap("extract_names")
+        text = self.heading_pattern.sub(" ", text)
+        timer.lap("strip_headings")
+        text = self.regular_link_pattern.sub(link_contents, text)
+        text = self.piped_link_pattern.sub(pipe_contents, text)
+        timer.lap("plain_links")
+        # strip_files runs the same pattern twice
+        text = self.file_pattern.sub(" ", text)
+        text = self.file_pattern.sub(" ", text)
+        timer.lap("strip_files")
+        text = self.nl_pattern.sub(" ", text)
+        timer.lap("strip_newlines")
+        text = self.format_pattern.sub("", text)
+        text = self.misc_table_pattern.sub("", text)
+        text = self.empty_paren_pattern.sub("", text)
+        text = self.bullet_pattern.sub("", text)
+        text = self.strip_ugly_links(text)
+        text = text.replace('\\n', '\n')
+        timer.lap("strip_misc")
+        return text, names, categories
+
+    def strip_templates(self, text):
+        '''Removes all top level templates.
+        '''
+        wikicode = mwp.parse(text)
+        templates = wikicode.filter_templates(recursive=False)
+        for t in templates:
+            text = text.replace(str(t), '')
+        return text
+
+    def extract_names(self, text):
+        '''Same as extract_names.
+        '''
+        par1 = text.split('.\\n', maxsplit=1)[0]
+        return self.alias_pattern.findall(par1)
+
+    def extract_categories(self, text):
+        '''Same as extract_categories.
+        '''
+        par1 = text.split('.\\n', maxsplit=1)[0]
+        return [self.clean_category(category) for category in self.category_pattern.findall(par1)]
+
+    def clean_category(self, text):
+        '''Same as clean_category.
+        '''
+        text = self.category_prefix_pattern.sub('', text)
+        text = self.category_end_pattern.sub('', text)
+        return self.category_pipe_pattern.sub('', text)
+
+    def strip_imagemap(self, text):
+        '''Same as strip_imagemap: from the first <imagemap>
+            to the last </imagemap>.
+        '''
+        start = text.find('<imagemap>')
+        if start == -1:
+            return text
+        end = text.rfind('</imagemap>')
+        if end < start + len('<imagemap>') + 1:
+            return text
+        return text[:start] + " " + text[end + len('</imagemap>'):]
+
+    def strip_tables(self, text):
+        '''Same as strip_tables: from the first {| followed by
+            "class" and "wikitable" to the last table end after them.
+        '''
+        start = text.find('{|')
+        if start == -1:
+            return text
+        class_start = text.find('class', start + 2)
+        if class_start == -1:
+            return text
+        wikitable_start = text.find('wikitable', class_start + 5)
+        if wikitable_start == -1:
+            return text
+        end = text.rfind('|}', wikitable_start + 9)
+        if end != -1:
+            end += 2
+        if '\\n\\n' in text:
+            for table_end in self.table_end_pattern.finditer(text, wikitable_start + 9):
+                if table_end.start() > end - 2:
+                    end = table_end.end()
+        if end == -1:
+            return text
+        return text[:start] + " " + text[end:]
+
+    def strip_galleries(self, text):
+        '''Same as strip_galleries: from the first <gallery...>
+            to the last </gallery>.
+        '''
+        start = text.find('<gallery')
+        while start != -1:
+            line_end = text.find('\n', start)
+            if line_end == -1:
+                line_end = len(text)
+            tag_end = text.find('>', start + len('<gallery'), line_end)
+            if tag_end != -1:
+                end = text.rfind('</gallery>')
+                if end < tag_end + 2:
+                    return text
+                return text[:start] + " " + text[end + len('</gallery>'):]
+            start = text.find('<gallery', start + 1)
+        return text
+
+    def strip_ugly_links(self, text):
+        '''Same as the [http...] links of strip_misc: on every line
+            from the first [http to the last ] after it.
+        '''
+        parts = []
+        position = 0
+        while True:
+            start = text.find('[http', position)
+            if start == -1:
+                break
+            line_end = text.find('\n', start)
+            if line_end == -1:
+                line_end = len(text)
+            end = text.rfind(']', start + 5, line_end)
+            if end == -1:
+                # No ] after any [http of this line.
+                parts.append(text[position:line_end])
+                position = line_end
+                continue
+            parts.append(text[position:start])
+            position = end + 1
+        parts.append(text[position:])
+        return "".join(parts)
+
+
+class SinglePassPipeline(CleaningPipeline):
+    '''An alternative to CleaningPipeline that does not rewrite the
+        whole text once per step. The ~20 substitutions are fused:
+        1. refs and editor comments in one substitution.
+        2. the "misc." sections are a single greedy span, so it is
+           only cut out if it exists.
+        3. headings, files and links in one substitution.
+        4. the remaining junk (tags, inline tables, (), *) in one
+           substitution, and [http...] links if there are any.
+        Each fused substitution picks the leftmost construct, while
+        CleaningPipeline runs every step over the whole text before
+        the next one. The results are the same except for overlapping
+        constructs that rarely show up in real articles, e.g. a ref
+        that starts inside an editor comment and ends after it, or a
+        "(<span></span>)" that only becomes "()" once the tags are gone.
+        The top level templates are removed by the brace matching
+        TemplateStripper (template_stripper.py) instead of a full
+        mwparserfromhell parse.
+        Use golden_corpus.py to compare the two on sampled articles.
+    '''
+
+    def __init__(self, cleaning_vocab):
+        super().__init__(cleaning_vocab)
+        rd = cleaning_vocab
+        self.template_stripper = TemplateStripper()
+        not_file = '(?!'+rd['image']+'|'+rd['file']+')'
+        # A regular link inside a piped link label or a file caption.
+        # These are flattened before the outer link/file is matched
+        # in CleaningPipeline, so their ]] do not end the outer one.
+        inner_link = '\[\['+not_file+'[^\|\n]+?\]\]'
+        caption_link = '\[\['+not_file+'[^\[\]\n]*\]\]'
+        self.block_pattern = re.compile('<ref[\s\S]+?/(?:ref)?>|<\!--.+?-->')
+        self.inline_pattern = re.compile(
+            '(?P<heading>==+.+?==+)'
+            '|(?P<file>\[\[('+rd['image']+'|'+rd['file']+'):(?:'+caption_link+'|(?!'+caption_link+').)+?\]\])'
+            '|\[\['+not_file+'(?:(?P<link>[^\|]+?)\]\]'
+            '|(?P<target>[^\]]+?)\|(?P<label>(?:'+inner_link+'|(?!'+inner_link+').)+?)\]\])')
+        self.junk_pattern = re.compile('<.+?>|\{\|.+?\|\}|\(\)|\*')
+
+    def clean(self, text, time_budget=None):
+        '''Cleans the text of one article.
+            Returns (text, names, categories) like process_text.
+        '''
+        timer = profiling.timer("clean.", time_budget)
+        text = self.strip_templates(text)
+        timer.lap("strip_templates")
+        categories = self.extract_categories(text)
+        timer.lap("extract_categories")
+        text = self.block_pattern.sub(" ", text)
+        timer.lap("strip_blocks")
+        text = self.strip_imagemap(text)
+        timer.lap("strip_imagemap")
+        text = self.strip_tables(text)
+        timer.lap("strip_tables")
+        text = self.strip_galleries(text)
+        timer.lap("strip_galleries")
+        etc_section = self.etc_pattern.search(text)
+        if etc_section:
+            text = text[:etc_section.start()] + " "
+        timer.lap("remove_etc_sections")
+        text = self.category_pattern.sub("", text)
+        timer.lap("strip_categories")
+        names = self.extract_names(text)
+        timer.lap("extract_names")
+        text = self.inline_pattern.sub(self.inline_contents, text)
+        timer.lap("strip_inline")
+        if '\\n' in text:
+            text = self.nl_pattern.sub(" ", text)
+        timer.lap("strip_newlines")
+        text = self.junk_pattern.sub("", text)
+        # Greedy up to the last ] of the line, which may be inside
+        # a tag that is only removed by the junk substitution.
+        text = self.strip_ugly_links(text)
+        text = text.replace('\\n', '\n')
+        timer.lap("strip_misc")
+        return text, names, categories
+
+    def strip_templates(self, text):
+        return self.template_stripper.strip(text)
+
+    def inline_contents(self, match):
+        '''Support function for the inline substitution.
+            Headings and files become " ", links their text.
+        '''
+        if match.group("link") is not None:
+            return match.group("link")
+        if match.group("label") is not None:
+            return self.regular_link_pattern.sub(link_contents, match.group("label"))
+        return " "
+
+
+# Part of the key of the cache in clean_cache.py. Has to be
+# increased when a change to the cleaning changes its output.
+CLEANING_VERSION = 1
+
+CLEANING_ENGINES = {
+    "pipeline": CleaningPipeline,
+    "single_pass": SinglePassPipeline,
+}
+
+
+def process_text_reference(text, language):
+    '''The original implementation of process_text, one function
+        per step with the patterns built on every call.
+        Kept as the reference that CleaningPipeline is checked
+        and benchmarked against.
+
         ***WARNING***
         Be careful when changing the order of the functions
         as they might depend on previous functions to work 
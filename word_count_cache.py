@@ -0,0 +1,63 @@
+'''This file contains a cache of the word counts of the Chinese
+    biographies, which are segmented with jieba (see
+    corpus_statistics.py). Segmenting a whole corpus takes much
+    longer than reading it, so the counts are kept in a SQLite
+    database keyed by the article id, with a hash of the text to
+    notice articles that changed since they were counted.
+'''
+
+import hashlib
+import sqlite3
+
+COMMIT_EVERY = 5000
+
+
+class WordCountCache:
+    '''Word counts by article id. Only used in the main process,
+        the workers only segment the texts that are not cached.
+    '''
+
+    def __init__(self, cache_path):
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS word_counts ("
+                                "id TEXT PRIMARY KEY, text_hash BLOB, words INTEGER)")
+        self.new_entries = []
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def get(self, page_id, text):
+        '''Returns the word count of the article or None if it was
+            not counted before or the text changed.
+        '''
+        row = self.connection.execute("SELECT text_hash, words FROM word_counts WHERE id = ?",
+                                      (str(page_id),)).fetchone()
+        if row is None or row[0] != self.text_hash(text):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[1]
+
+    def put(self, page_id, text, words):
+        self.new_entries.append((str(page_id), self.text_hash(text), words))
+        if len(self.new_entries) >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO word_counts (id, text_hash, words) VALUES (?, ?, ?)",
+                                        self.new_entries)
+        self.new_entries = []
+
+    def close(self):
+        self.commit()
+        self.connection.close()